@@ -12,9 +12,22 @@
 import asyncio
 import random
 import re
+import time
+from collections import OrderedDict
 from typing import Dict, List, Optional, Any, Tuple
-from datetime import datetime
 from pathlib import Path
+from urllib.parse import urlparse
+
+try:
+    from selectolax.parser import HTMLParser
+except ImportError:
+    HTMLParser = None
+
+
+_SCRIPT_RE = re.compile(r'<script[^>]*>.*?</script>', re.DOTALL | re.IGNORECASE)
+_STYLE_RE = re.compile(r'<style[^>]*>.*?</style>', re.DOTALL | re.IGNORECASE)
+_TAG_RE = re.compile(r'<[^>]+>')
+_WHITESPACE_RE = re.compile(r'\s+')
 
 
 class BrowserController:
@@ -31,18 +44,45 @@ class BrowserController:
         "Chrome/120.0.0.0 Safari/537.36"
     )
     
+    SELECTOR_PROBE_TIMEOUT = 0.5
+    LOGIN_CACHE_TTL = 300
+    LOGIN_CACHE_SIZE = 64
+    
+    _HANDLE_ACTION_SCRIPT = """
+        ([id, action, value]) => {
+            const el = window.__neoHandles && window.__neoHandles.get(id);
+            if (!el || !el.isConnected) return false;
+            if (action === 'click') {
+                el.click();
+                return true;
+            }
+            // 通过原生 value setter 赋值，React 等受控组件才能感知到输入
+            const proto = el instanceof HTMLInputElement ? HTMLInputElement.prototype
+                : el instanceof HTMLTextAreaElement ? HTMLTextAreaElement.prototype : null;
+            const nonText = ['checkbox', 'radio', 'file', 'submit', 'button', 'image', 'reset', 'hidden'];
+            if (!proto || el.disabled || el.readOnly || nonText.includes(el.type)) return false;
+            el.focus();
+            Object.getOwnPropertyDescriptor(proto, 'value').set.call(el, value);
+            el.dispatchEvent(new Event('input', { bubbles: true }));
+            el.dispatchEvent(new Event('change', { bubbles: true }));
+            return true;
+        }
+    """
+    
     def __init__(
         self,
         headless: bool = True,
         user_agent: str = None,
         viewport: Dict = None,
         slow_mo: int = 0,
-        screenshots_dir: str = "browser_agent/screenshots"
+        screenshots_dir: str = "browser_agent/screenshots",
+        skip_human_delay: bool = False
     ):
         self.headless = headless
         self.user_agent = user_agent or self.DEFAULT_USER_AGENT
         self.viewport = viewport or {"width": 1280, "height": 720}
         self.slow_mo = slow_mo
+        self._skip_human_delay = skip_human_delay
         self.screenshots_dir = Path(screenshots_dir)
         self.screenshots_dir.mkdir(parents=True, exist_ok=True)
         
@@ -53,6 +93,7 @@ class BrowserController:
         self.session_id = None
         
         self._playwright = None
+        self._login_cache: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
     
     async def initialize(self) -> bool:
         try:
@@ -110,11 +151,33 @@ class BrowserController:
             };
         """)
     
-    async def close(self):
-        if self.page:
-            await self.page.close()
+    async def reset_page(self) -> Dict[str, Any]:
+        if not self.page:
+            return {"success": False, "error": "浏览器未初始化"}
+        
+        try:
+            await self.page.goto("about:blank")
+            await self.context.clear_cookies()
+            self.current_url = ""
+            self.session_id = None
+            self.invalidate_login_cache()
+            
+            return {"success": True, "message": "页面已重置"}
+            
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+    
+    async def close(self, keep_warm: bool = False):
+        if keep_warm and self.page:
+            result = await self.reset_page()
+            if result["success"]:
+                return
+        
+        # context.close() 会一并关闭其下的所有页面，无需单独 page.close()
         if self.context:
             await self.context.close()
+        elif self.page:
+            await self.page.close()
         if self.browser:
             await self.browser.close()
         if self._playwright:
@@ -130,13 +193,12 @@ class BrowserController:
             return {"success": False, "error": "浏览器未初始化"}
         
         try:
-            await self.human_like_delay(0.5, 1.5)
+            await self.human_like_delay(0.8, 2.3)
             
             response = await self.page.goto(url, wait_until=wait_until, timeout=30000)
             
             self.current_url = self.page.url
-            
-            await self.human_like_delay(0.3, 0.8)
+            self.invalidate_login_cache(self.current_url)
             
             return {
                 "success": True,
@@ -164,16 +226,29 @@ class BrowserController:
     
     async def _get_page_content(self, max_length: int = 5000) -> str:
         content = await self.page.content()
-        text = re.sub(r'<script[^>]*>.*?</script>', '', content, flags=re.DOTALL | re.IGNORECASE)
-        text = re.sub(r'<style[^>]*>.*?</style>', '', text, flags=re.DOTALL | re.IGNORECASE)
-        text = re.sub(r'<[^>]+>', ' ', text)
-        text = re.sub(r'\s+', ' ', text).strip()
+        text = self._html_to_text(content)
         
         if len(text) > max_length:
             text = text[:max_length] + "\n... (内容已截断)"
         
         return text
     
+    @staticmethod
+    def _html_to_text(content: str) -> str:
+        if HTMLParser is not None:
+            tree = HTMLParser(content)
+            for node in tree.css("script, style"):
+                node.decompose()
+            root = tree.body or tree.root
+            if root is None:
+                return ""
+            return _WHITESPACE_RE.sub(' ', root.text(separator=' ', strip=True)).strip()
+        
+        text = _SCRIPT_RE.sub('', content)
+        text = _STYLE_RE.sub('', text)
+        text = _TAG_RE.sub(' ', text)
+        return _WHITESPACE_RE.sub(' ', text).strip()
+    
     async def get_dom_structure(self) -> Dict[str, Any]:
         if not self.page:
             return {"success": False, "error": "浏览器未初始化"}
@@ -193,10 +268,10 @@ class BrowserController:
                                     type: el.type || null,
                                     text: (el.innerText || el.value || el.placeholder || '').substring(0, 100),
                                     id: el.id || null,
-                                    className: el.className || null,
+                                    className: typeof el.className === 'string' ? el.className.substring(0, 100) || null : null,
                                     name: el.name || null,
-                                    href: el.href || null,
-                                    placeholder: el.placeholder || null,
+                                    href: el.href ? el.href.substring(0, 200) : null,
+                                    placeholder: el.placeholder ? el.placeholder.substring(0, 100) : null,
                                     index: index,
                                     visible: rect.width > 0 && rect.height > 0
                                 });
@@ -204,7 +279,7 @@ class BrowserController:
                         });
                     });
                     
-                    return elements;
+                    return elements.slice(0, 50);
                 }
             """)
             
@@ -212,7 +287,7 @@ class BrowserController:
                 "success": True,
                 "url": self.page.url,
                 "title": await self.page.title(),
-                "interactive_elements": interactive_elements[:50]
+                "interactive_elements": interactive_elements
             }
             
         except Exception as e:
@@ -238,19 +313,25 @@ class BrowserController:
                 () => {{
                     const searchText = "{description.lower()}";
                     const elements = [];
+                    window.__neoHandles = new Map();
                     
                     document.querySelectorAll('a, button, input, select, textarea, [onclick], [role="button"]').forEach((el, i) => {{
+                        if (elements.length >= 10) return;
                         const text = (el.innerText || el.value || el.placeholder || el.name || el.id || '').toLowerCase();
                         if (text.includes(searchText)) {{
+                            const handleId = elements.length;
+                            window.__neoHandles.set(handleId, el);
                             elements.push({{
                                 tag: el.tagName.toLowerCase(),
-                                text: el.innerText || el.value || '',
-                                index: i
+                                text: ((el.innerText || el.value || '') + '').slice(0, 200),
+                                name: el.name || null,
+                                index: i,
+                                handleId: handleId
                             }});
                         }}
                     }});
                     
-                    return elements.slice(0, 10);
+                    return elements;
                 }}
             """)
             
@@ -267,6 +348,21 @@ class BrowserController:
         except Exception as e:
             return {"success": False, "error": str(e)}
     
+    async def _act_on_handle(self, handle_id: Optional[int], action: str, value: str = "") -> bool:
+        """
+        直接操作 find_element 扫描时缓存在页面中的元素，避免再次解析选择器和遍历DOM
+        
+        Returns:
+            元素仍然存在并已执行操作时返回True，否则返回False由调用方回退到选择器方式
+        """
+        if handle_id is None:
+            return False
+        
+        try:
+            return await self.page.evaluate(self._HANDLE_ACTION_SCRIPT, [handle_id, action, value])
+        except Exception:
+            return False
+    
     async def _description_to_selector(self, description: str) -> Optional[str]:
         desc_lower = description.lower()
         
@@ -278,13 +374,32 @@ class BrowserController:
             f'[title*="{description}"]',
         ]
         
-        for selector in text_selectors:
-            try:
-                element = await self.page.query_selector(selector)
-                if element:
-                    return selector
-            except:
-                continue
+        tasks = {
+            asyncio.create_task(self.page.query_selector(selector)): selector
+            for selector in text_selectors
+        }
+        pending = set(tasks)
+        deadline = asyncio.get_running_loop().time() + self.SELECTOR_PROBE_TIMEOUT
+        
+        try:
+            while pending:
+                timeout = deadline - asyncio.get_running_loop().time()
+                if timeout <= 0:
+                    break
+                
+                done, pending = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                
+                for task in done:
+                    try:
+                        if task.result():
+                            return tasks[task]
+                    except Exception:
+                        continue
+        finally:
+            for task in pending:
+                task.cancel()
         
         return None
     
@@ -298,18 +413,20 @@ class BrowserController:
             if not find_result.get("found"):
                 return {"success": False, "error": f"未找到元素: {target}"}
             
+            await self.human_like_delay(0.8, 1.8)
+            
             if find_result.get("selector"):
-                await self.human_like_delay(0.3, 0.8)
                 await self.page.click(find_result["selector"])
             else:
                 elements = find_result.get("elements", [])
                 if elements:
                     first = elements[0]
-                    selector = f"{first['tag']}:has-text('{first['text'][:50]}')"
-                    await self.human_like_delay(0.3, 0.8)
-                    await self.page.click(selector)
+                    if not await self._act_on_handle(first.get("handleId"), "click"):
+                        selector = f"{first['tag']}:has-text('{first['text'][:50]}')"
+                        await self.page.click(selector)
             
-            await self.human_like_delay(0.5, 1.0)
+            # 点击可能提交了表单，登录状态随之变化
+            self.invalidate_login_cache(self.page.url)
             
             return {
                 "success": True,
@@ -330,20 +447,23 @@ class BrowserController:
             if not find_result.get("found"):
                 return {"success": False, "error": f"未找到输入框: {target}"}
             
+            await self.human_like_delay(0.3, 0.8)
+            
             if find_result.get("selector"):
-                await self.human_like_delay(0.2, 0.5)
                 await self.page.fill(find_result["selector"], value)
             else:
                 elements = find_result.get("elements", [])
                 if elements:
                     first = elements[0]
-                    selector = f"{first['tag']}[name*='{first.get('name', '') or first.get('text', '')[:20]}']"
-                    try:
-                        await self.page.fill(selector, value)
-                    except:
-                        await self.page.type(f"{first['tag']}:nth-of-type({first['index'] + 1})", value)
+                    if not await self._act_on_handle(first.get("handleId"), "fill", value):
+                        selector = f"{first['tag']}[name*='{first.get('name', '') or first.get('text', '')[:20]}']"
+                        try:
+                            await self.page.fill(selector, value)
+                        except:
+                            await self.page.type(f"{first['tag']}:nth-of-type({first['index'] + 1})", value)
             
-            await self.human_like_delay(0.1, 0.3)
+            # 输入触发的自动提交同样可能改变登录状态
+            self.invalidate_login_cache(self.page.url)
             
             return {
                 "success": True,
@@ -358,29 +478,52 @@ class BrowserController:
             return {"success": False, "error": "浏览器未初始化"}
         
         try:
+            await self.human_like_delay(0.3, 0.6)
+            
             if direction == "down":
                 await self.page.evaluate(f"window.scrollBy(0, {amount})")
             elif direction == "up":
                 await self.page.evaluate(f"window.scrollBy(0, -{amount})")
             
-            await self.human_like_delay(0.3, 0.6)
-            
             return {"success": True, "message": f"已滚动 {direction} {amount}px"}
             
         except Exception as e:
             return {"success": False, "error": str(e)}
     
-    async def screenshot(self, name: str = None) -> Dict[str, Any]:
+    async def screenshot(
+        self,
+        name: str = None,
+        kind: str = "jpeg",
+        quality: int = 70,
+        clip: Dict = None
+    ) -> Dict[str, Any]:
+        """
+        截图
+        
+        未指定name时不落盘，直接在结果的data字段中返回图片字节
+        """
         if not self.page:
             return {"success": False, "error": "浏览器未初始化"}
         
         try:
+            options = {"type": kind, "full_page": False}
+            if kind == "jpeg":
+                options["quality"] = quality
+            if clip:
+                options["clip"] = clip
+            
             if not name:
-                name = f"screenshot_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+                data = await self.page.screenshot(**options)
+                return {
+                    "success": True,
+                    "message": "截图成功",
+                    "data": data
+                }
             
-            filepath = self.screenshots_dir / f"{name}.png"
+            suffix = "jpg" if kind == "jpeg" else kind
+            filepath = self.screenshots_dir / f"{name}.{suffix}"
             
-            await self.page.screenshot(path=str(filepath), full_page=False)
+            await self.page.screenshot(path=str(filepath), **options)
             
             return {
                 "success": True,
@@ -391,7 +534,7 @@ class BrowserController:
         except Exception as e:
             return {"success": False, "error": str(e)}
     
-    async def extract_text(self, selector: str = None) -> Dict[str, Any]:
+    async def extract_text(self, selector: str = None, max_length: int = 10000) -> Dict[str, Any]:
         if not self.page:
             return {"success": False, "error": "浏览器未初始化"}
         
@@ -399,11 +542,13 @@ class BrowserController:
             if selector:
                 element = await self.page.query_selector(selector)
                 if element:
-                    text = await element.inner_text()
+                    text = await element.evaluate(
+                        "(el, n) => (el.innerText || '').slice(0, n)", max_length
+                    )
                 else:
                     return {"success": False, "error": f"未找到选择器: {selector}"}
             else:
-                text = await self._get_page_content(max_length=10000)
+                text = await self._get_page_content(max_length=max_length)
             
             return {
                 "success": True,
@@ -433,6 +578,12 @@ class BrowserController:
         if not self.page:
             return {"success": False, "error": "浏览器未初始化"}
         
+        cache_key = self._login_cache_key(self.page.url)
+        cached = self._login_cache.get(cache_key)
+        if cached and time.monotonic() - cached[0] < self.LOGIN_CACHE_TTL:
+            self._login_cache.move_to_end(cache_key)
+            return cached[1]
+        
         try:
             login_indicators = await self.page.evaluate("""
                 () => {
@@ -456,15 +607,35 @@ class BrowserController:
                 }
             """)
             
-            return {
+            result = {
                 "success": True,
                 "requires_login": login_indicators.get("likelyRequiresLogin", False),
                 "details": login_indicators
             }
+            self._login_cache[cache_key] = (time.monotonic(), result)
+            self._login_cache.move_to_end(cache_key)
+            if len(self._login_cache) > self.LOGIN_CACHE_SIZE:
+                self._login_cache.popitem(last=False)
+            return result
             
         except Exception as e:
             return {"success": False, "error": str(e)}
     
+    @staticmethod
+    def _login_cache_key(url: str) -> str:
+        parsed = urlparse(url)
+        path_prefix = parsed.path.strip("/").split("/", 1)[0]
+        return f"{parsed.netloc}/{path_prefix}"
+    
+    def invalidate_login_cache(self, url: str = None):
+        if url is None:
+            self._login_cache.clear()
+            return
+        
+        netloc = urlparse(url).netloc
+        for key in [k for k in self._login_cache if k.split("/", 1)[0] == netloc]:
+            del self._login_cache[key]
+    
     async def get_cookies(self) -> List[Dict]:
         if not self.context:
             return []
@@ -479,6 +650,8 @@ class BrowserController:
         await self.context.add_cookies(cookies)
     
     async def human_like_delay(self, min_seconds: float = 0.1, max_seconds: float = 0.5):
+        if self._skip_human_delay:
+            return
         delay = random.uniform(min_seconds, max_seconds)
         await asyncio.sleep(delay)
     
@@ -13,11 +13,96 @@ Browser Agent Skill - 主技能入口
 
 import asyncio
 import os
-from typing import Dict, Any, Optional, Callable
+import re
+import sys
+import time
+from datetime import datetime
+from typing import Dict, Any, Optional, Callable, Awaitable, Tuple
 from .browser_controller import BrowserController
 from .safety_guard import SafetyGuard, OperationLevel
 from .session_manager import SessionManager
 
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+if sys.platform == "win32":
+    uvloop = None
+
+
+_ACTIONS = (
+    "navigate", "read", "click", "fill",
+    "login", "scroll", "screenshot",
+    "extract", "get_dom", "wait",
+    "check_login", "close"
+)
+
+_USERNAME_HINT_RE = re.compile(r"user|email", re.IGNORECASE)
+_LOGIN_TEXT_RE = re.compile(r"登录|login|sign", re.IGNORECASE)
+
+
+async def _do_navigate(controller: BrowserController, arguments: dict) -> dict:
+    url = arguments.get("url", "")
+    if not url:
+        return {"success": False, "error": "navigate操作需要url参数"}
+    
+    result = await controller.navigate(url)
+    
+    if result["success"]:
+        BrowserSkill._dom_cache.pop(result["url"], None)
+        login_check = await controller.check_login_required()
+        result["login_required"] = login_check.get("requires_login", False)
+        
+        if _SESSION_MGR.has_credentials(url):
+            result["has_saved_credentials"] = True
+    
+    return result
+
+
+async def _do_click(controller: BrowserController, arguments: dict) -> dict:
+    target = arguments.get("target", "")
+    if not target:
+        return {"success": False, "error": "click操作需要target参数"}
+    return await controller.click(target)
+
+
+async def _do_fill(controller: BrowserController, arguments: dict) -> dict:
+    target = arguments.get("target", "")
+    value = arguments.get("value", "")
+    if not target or not value:
+        return {"success": False, "error": "fill操作需要target和value参数"}
+    return await controller.fill(target, value)
+
+
+async def _do_login(controller: BrowserController, arguments: dict) -> dict:
+    return await BrowserSkill._handle_login(
+        arguments.get("url", ""),
+        arguments.get("target", ""),
+        arguments.get("value", "")
+    )
+
+
+async def _do_screenshot(controller: BrowserController, arguments: dict) -> dict:
+    return await controller.screenshot(
+        name=f"screenshot_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    )
+
+
+_ACTION_HANDLERS: Dict[str, Callable[[BrowserController, dict], Awaitable[dict]]] = {
+    "navigate": _do_navigate,
+    "read": lambda c, a: c.get_page_info(),
+    "get_dom": lambda c, a: c.get_dom_structure(),
+    "click": _do_click,
+    "fill": _do_fill,
+    "login": _do_login,
+    "scroll": lambda c, a: c.scroll(a.get("direction", "down")),
+    "screenshot": _do_screenshot,
+    "extract": lambda c, a: c.extract_text(a.get("selector", "")),
+    "wait": lambda c, a: c.wait_for(a.get("selector", "")),
+    "check_login": lambda c, a: c.check_login_required(),
+}
+
 
 class BrowserSkill:
     """
@@ -28,29 +113,22 @@ class BrowserSkill:
     
     _instance = None
     _controller = None
-    _safety_guard = None
-    _session_manager = None
     _initialized = False
+    _loop = None
+    _dom_cache: Dict[str, Tuple[float, dict]] = {}
+    
+    DOM_CACHE_TTL = 2.0
     
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super().__new__(cls)
         return cls._instance
     
-    @classmethod
-    def _ensure_initialized(cls):
-        if cls._safety_guard is None:
-            cls._safety_guard = SafetyGuard()
-        if cls._session_manager is None:
-            cls._session_manager = SessionManager()
-    
-    @staticmethod
-    def get_tool_definition():
-        return {
-            "type": "function",
-            "function": {
-                "name": "browser_agent",
-                "description": """像真人一样使用浏览器访问**任何网站**。这是获取网页信息的主要工具。
+    TOOL_DEFINITION = {
+        "type": "function",
+        "function": {
+            "name": "browser_agent",
+            "description": """像真人一样使用浏览器访问**任何网站**。这是获取网页信息的主要工具。
 
 **重要：当需要访问网站、获取网页内容时，优先使用此工具！**
 
@@ -78,76 +156,77 @@ class BrowserSkill:
 - 获取内容: read() 或 extract()
 
 安全说明：敏感操作需要用户确认。""",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "action": {
-                            "type": "string",
-                            "enum": [
-                                "navigate", "read", "click", "fill", 
-                                "login", "scroll", "screenshot", 
-                                "extract", "get_dom", "wait",
-                                "check_login", "close"
-                            ],
-                            "description": "要执行的操作类型"
-                        },
-                        "url": {
-                            "type": "string",
-                            "description": "目标URL（用于navigate操作）"
-                        },
-                        "target": {
-                            "type": "string",
-                            "description": "目标元素描述（用于click、fill等操作）"
-                        },
-                        "value": {
-                            "type": "string",
-                            "description": "输入值（用于fill操作）"
-                        },
-                        "selector": {
-                            "type": "string",
-                            "description": "CSS选择器（用于extract操作）"
-                        },
-                        "direction": {
-                            "type": "string",
-                            "enum": ["up", "down"],
-                            "description": "滚动方向（用于scroll操作）"
-                        },
-                        "headless": {
-                            "type": "boolean",
-                            "description": "是否无头模式运行，默认true"
-                        },
-                        "auto_confirm": {
-                            "type": "boolean",
-                            "description": "是否自动确认敏感操作，默认false"
-                        }
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "action": {
+                        "type": "string",
+                        "enum": _ACTIONS,
+                        "description": "要执行的操作类型"
+                    },
+                    "url": {
+                        "type": "string",
+                        "description": "目标URL（用于navigate操作）"
+                    },
+                    "target": {
+                        "type": "string",
+                        "description": "目标元素描述（用于click、fill等操作）"
+                    },
+                    "value": {
+                        "type": "string",
+                        "description": "输入值（用于fill操作）"
+                    },
+                    "selector": {
+                        "type": "string",
+                        "description": "CSS选择器（用于extract操作）"
+                    },
+                    "direction": {
+                        "type": "string",
+                        "enum": ["up", "down"],
+                        "description": "滚动方向（用于scroll操作）"
+                    },
+                    "headless": {
+                        "type": "boolean",
+                        "description": "是否无头模式运行，默认true"
                     },
-                    "required": ["action"]
-                }
+                    "auto_confirm": {
+                        "type": "boolean",
+                        "description": "是否自动确认敏感操作，默认false"
+                    },
+                    "fast_mode": {
+                        "type": "boolean",
+                        "description": "是否跳过模拟人类操作的随机延迟，默认false"
+                    },
+                    "keep_warm": {
+                        "type": "boolean",
+                        "description": "close时只清空页面和Cookie、保留浏览器进程供后续任务复用，默认false"
+                    }
+                },
+                "required": ["action"]
             }
         }
+    }
+    
+    @staticmethod
+    def get_tool_definition():
+        return BrowserSkill.TOOL_DEFINITION
     
     @staticmethod
     def run(arguments: dict) -> dict:
-        BrowserSkill._ensure_initialized()
-        
         action = arguments.get("action", "")
         
         if not action:
             return {
                 "success": False,
                 "error": "缺少action参数",
-                "available_actions": [
-                    "navigate", "read", "click", "fill", "login",
-                    "scroll", "screenshot", "extract", "get_dom", 
-                    "wait", "check_login", "close"
-                ]
+                "available_actions": _ACTIONS
             }
         
-        try:
-            loop = asyncio.get_event_loop()
-        except RuntimeError:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
+        loop = BrowserSkill._loop
+        if loop is None or loop.is_closed():
+            loop = uvloop.new_event_loop() if uvloop is not None else asyncio.new_event_loop()
+            BrowserSkill._loop = loop
+        asyncio.set_event_loop(loop)
         
         return loop.run_until_complete(
             BrowserSkill._execute_action_async(arguments)
@@ -158,26 +237,29 @@ class BrowserSkill:
         action = arguments.get("action", "")
         
         if action == "close":
-            return await BrowserSkill._close_browser()
+            return await BrowserSkill._close_browser(keep_warm=arguments.get("keep_warm", False))
+        
+        handler = _ACTION_HANDLERS.get(action)
+        if handler is None:
+            return {"success": False, "error": f"未知操作: {action}"}
         
         if BrowserSkill._controller is None or not BrowserSkill._initialized:
             headless = arguments.get("headless", True)
-            init_result = await BrowserSkill._initialize_browser(headless=headless)
+            fast_mode = arguments.get("fast_mode", False)
+            init_result = await BrowserSkill._initialize_browser(
+                headless=headless,
+                skip_human_delay=fast_mode
+            )
             if not init_result["success"]:
                 return init_result
         
-        url = arguments.get("url", "")
-        target = arguments.get("target", "")
-        value = arguments.get("value", "")
-        selector = arguments.get("selector", "")
-        direction = arguments.get("direction", "down")
-        auto_confirm = arguments.get("auto_confirm", False)
+        target = arguments.get("target", "") or arguments.get("url", "")
         
-        safety_check = BrowserSkill._safety_guard.check_operation(
+        safety_check = _SAFETY_GUARD.check_operation(
             action=action,
-            target=target or url,
-            value=value,
-            auto_confirm=auto_confirm
+            target=target,
+            value=arguments.get("value", ""),
+            auto_confirm=arguments.get("auto_confirm", False)
         )
         
         if not safety_check["allowed"]:
@@ -189,63 +271,14 @@ class BrowserSkill:
                 "confirmation_message": safety_check.get("confirmation_message", "")
             }
         
-        controller = BrowserSkill._controller
-        
-        if action == "navigate":
-            if not url:
-                return {"success": False, "error": "navigate操作需要url参数"}
-            
-            result = await controller.navigate(url)
-            
-            if result["success"]:
-                login_check = await controller.check_login_required()
-                result["login_required"] = login_check.get("requires_login", False)
-                
-                if BrowserSkill._session_manager.has_credentials(url):
-                    result["has_saved_credentials"] = True
-            
-            return result
-        
-        elif action == "read":
-            return await controller.get_page_info()
-        
-        elif action == "get_dom":
-            return await controller.get_dom_structure()
-        
-        elif action == "click":
-            if not target:
-                return {"success": False, "error": "click操作需要target参数"}
-            return await controller.click(target)
-        
-        elif action == "fill":
-            if not target or not value:
-                return {"success": False, "error": "fill操作需要target和value参数"}
-            return await controller.fill(target, value)
-        
-        elif action == "login":
-            return await BrowserSkill._handle_login(url, target, value)
-        
-        elif action == "scroll":
-            return await controller.scroll(direction)
-        
-        elif action == "screenshot":
-            return await controller.screenshot()
-        
-        elif action == "extract":
-            return await controller.extract_text(selector)
-        
-        elif action == "wait":
-            return await controller.wait_for(selector)
-        
-        elif action == "check_login":
-            return await controller.check_login_required()
-        
-        else:
-            return {"success": False, "error": f"未知操作: {action}"}
+        return await handler(BrowserSkill._controller, arguments)
     
     @staticmethod
-    async def _initialize_browser(headless: bool = True) -> dict:
-        BrowserSkill._controller = BrowserController(headless=headless)
+    async def _initialize_browser(headless: bool = True, skip_human_delay: bool = False) -> dict:
+        BrowserSkill._controller = BrowserController(
+            headless=headless,
+            skip_human_delay=skip_human_delay
+        )
         
         success = await BrowserSkill._controller.initialize()
         
@@ -266,13 +299,10 @@ class BrowserSkill:
     @staticmethod
     async def _handle_login(url: str, target: str, value: str) -> dict:
         controller = BrowserSkill._controller
-        session_manager = BrowserSkill._session_manager
+        session_manager = _SESSION_MGR
         
         current_url = controller.current_url or url
-        credentials = None
-        
-        if session_manager.has_credentials(current_url):
-            credentials = session_manager.get_credentials(current_url)
+        credentials = session_manager.get_credentials(current_url)
         
         if not credentials:
             return {
@@ -282,7 +312,14 @@ class BrowserSkill:
             }
         
         try:
-            dom = await controller.get_dom_structure()
+            cached = BrowserSkill._dom_cache.get(current_url)
+            if cached and time.monotonic() - cached[0] < BrowserSkill.DOM_CACHE_TTL:
+                dom = cached[1]
+            else:
+                dom = await controller.get_dom_structure()
+                if dom.get("success"):
+                    BrowserSkill._dom_cache[current_url] = (time.monotonic(), dom)
+            
             elements = dom.get("interactive_elements", [])
             
             username_field = None
@@ -290,21 +327,24 @@ class BrowserSkill:
             login_button = None
             
             for el in elements:
-                el_type = (el.get("type") or "").lower()
-                el_tag = el.get("tag", "")
-                el_text = (el.get("text") or "").lower()
-                el_name = (el.get("name") or "").lower()
-                el_placeholder = (el.get("placeholder") or "").lower()
+                get = el.get
+                el_type = (get("type") or "").lower()
+                el_tag = get("tag", "")
                 
                 if el_tag == "input":
                     if el_type == "password":
                         password_field = el
-                    elif el_type in ["text", "email"] or "user" in el_name or "email" in el_name or "email" in el_placeholder:
+                    elif el_type in ("text", "email") or _USERNAME_HINT_RE.search(
+                        f"{get('name') or ''} {get('placeholder') or ''}"
+                    ):
                         username_field = el
                 
                 if el_tag == "button" or el_type == "submit":
-                    if "登录" in el_text or "login" in el_text or "sign" in el_text:
+                    if _LOGIN_TEXT_RE.search(get("text") or ""):
                         login_button = el
+                
+                if username_field and password_field and login_button:
+                    break
             
             if username_field:
                 username_selector = f"input[name='{username_field.get('name')}']" if username_field.get("name") else f"input[type='{username_field.get('type', 'text')}']"
@@ -319,6 +359,8 @@ class BrowserSkill:
             
             await controller.human_like_delay(1, 2)
             
+            controller.invalidate_login_cache(current_url)
+            
             cookies = await controller.get_cookies()
             
             session = session_manager.get_session_for_site(current_url)
@@ -349,57 +391,61 @@ class BrowserSkill:
             return {"success": False, "error": f"登录失败: {str(e)}"}
     
     @staticmethod
-    async def _close_browser() -> dict:
+    async def _close_browser(keep_warm: bool = False) -> dict:
+        BrowserSkill._dom_cache.clear()
         if BrowserSkill._controller:
-            await BrowserSkill._controller.close()
-            BrowserSkill._controller = None
-            BrowserSkill._initialized = False
+            await BrowserSkill._controller.close(keep_warm=keep_warm)
+            # 保温重置失败时 close 会完全关闭浏览器，此时 page 为 None
+            if BrowserSkill._controller.page is None:
+                BrowserSkill._controller = None
+                BrowserSkill._initialized = False
         
-        audit_path = BrowserSkill._safety_guard.save_audit_logs()
+        _SESSION_MGR.flush()
+        audit_path = _SAFETY_GUARD.save_audit_logs()
         
         return {
             "success": True,
-            "message": "浏览器已关闭",
+            "message": "浏览器已重置" if BrowserSkill._controller else "浏览器已关闭",
             "audit_log": audit_path,
-            "session_summary": BrowserSkill._safety_guard.get_session_summary()
+            "session_summary": _SAFETY_GUARD.get_session_summary()
         }
 
 
 class BrowserCredentialSkill:
     """凭证管理技能"""
     
-    @staticmethod
-    def get_tool_definition():
-        return {
-            "type": "function",
-            "function": {
-                "name": "browser_agent_save_credentials",
-                "description": "保存网站的登录凭证，供Browser Agent自动登录使用。凭证会被加密存储。",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "site_url": {
-                            "type": "string",
-                            "description": "网站URL"
-                        },
-                        "username": {
-                            "type": "string",
-                            "description": "用户名或邮箱"
-                        },
-                        "password": {
-                            "type": "string",
-                            "description": "密码"
-                        }
+    TOOL_DEFINITION = {
+        "type": "function",
+        "function": {
+            "name": "browser_agent_save_credentials",
+            "description": "保存网站的登录凭证，供Browser Agent自动登录使用。凭证会被加密存储。",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "site_url": {
+                        "type": "string",
+                        "description": "网站URL"
+                    },
+                    "username": {
+                        "type": "string",
+                        "description": "用户名或邮箱"
                     },
-                    "required": ["site_url", "username", "password"]
-                }
+                    "password": {
+                        "type": "string",
+                        "description": "密码"
+                    }
+                },
+                "required": ["site_url", "username", "password"]
             }
         }
+    }
+    
+    @staticmethod
+    def get_tool_definition():
+        return BrowserCredentialSkill.TOOL_DEFINITION
     
     @staticmethod
     def run(arguments: dict) -> dict:
-        BrowserSkill._ensure_initialized()
-        
         site_url = arguments.get("site_url", "")
         username = arguments.get("username", "")
         password = arguments.get("password", "")
@@ -407,7 +453,7 @@ class BrowserCredentialSkill:
         if not all([site_url, username, password]):
             return {"success": False, "error": "缺少必要参数"}
         
-        BrowserSkill._session_manager.save_credentials(site_url, username, password)
+        _SESSION_MGR.save_credentials(site_url, username, password)
         
         return {
             "success": True,
@@ -419,29 +465,34 @@ class BrowserCredentialSkill:
 class BrowserListSitesSkill:
     """列出已保存的网站"""
     
-    @staticmethod
-    def get_tool_definition():
-        return {
-            "type": "function",
-            "function": {
-                "name": "browser_agent_list_sites",
-                "description": "列出所有已保存登录凭证和会话的网站",
-                "parameters": {
-                    "type": "object",
-                    "properties": {},
-                    "required": []
-                }
+    TOOL_DEFINITION = {
+        "type": "function",
+        "function": {
+            "name": "browser_agent_list_sites",
+            "description": "列出所有已保存登录凭证和会话的网站",
+            "parameters": {
+                "type": "object",
+                "properties": {},
+                "required": []
             }
         }
+    }
+    
+    @staticmethod
+    def get_tool_definition():
+        return BrowserListSitesSkill.TOOL_DEFINITION
     
     @staticmethod
     def run(arguments: dict) -> dict:
-        BrowserSkill._ensure_initialized()
-        
-        sites = BrowserSkill._session_manager.list_saved_sites()
+        sites = _SESSION_MGR.list_saved_sites()
         
         return {
             "success": True,
             "sites": sites,
             "count": len(sites)
         }
+
+
+# 模块导入时一次性创建，避免每次调用时的懒初始化检查和并发竞争
+_SAFETY_GUARD = SafetyGuard()
+_SESSION_MGR = SessionManager()
@@ -8,12 +8,33 @@
 4. 用户确认机制
 """
 
+import functools
 import json
 import os
+import re
+import shutil
+import time
+from collections import deque
 from datetime import datetime
 from enum import Enum
-from typing import Dict, List, Optional, Callable, Any
-from dataclasses import dataclass, field
+from typing import Deque, Dict, Optional, Callable, Any, Tuple
+from dataclasses import dataclass, asdict
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+_UNSAFE_URL_RE = re.compile(r"\s*(?:javascript:|data:|vbscript:|file://|ftp://)", re.IGNORECASE)
+_SAFE_URL_RE = re.compile(r"\s*(?:https?://|/|\.)", re.IGNORECASE)
+
+
+def _compile_alternation(words) -> "re.Pattern":
+    if not words:
+        return re.compile(r"(?!)")
+    ordered = sorted({w.lower() for w in words}, key=len, reverse=True)
+    return re.compile("|".join(map(re.escape, ordered)))
 
 
 class OperationLevel(Enum):
@@ -22,15 +43,27 @@ class OperationLevel(Enum):
     FORBIDDEN = "forbidden"
 
 
-@dataclass
+@dataclass(slots=True)
 class AuditLog:
-    timestamp: str
+    timestamp: float
     action: str
     target: str
-    level: OperationLevel
+    level: str
     approved: bool
     result: str
-    details: Dict = field(default_factory=dict)
+    details: Optional[Dict] = None
+    
+    def isoformat(self) -> str:
+        return datetime.fromtimestamp(self.timestamp).isoformat()
+
+
+def _audit_line(log: AuditLog) -> bytes:
+    # 内存中保存时间戳数值，落盘时仍写 ISO 字符串，保持审计文件格式不变
+    record = asdict(log)
+    record["timestamp"] = log.isoformat()
+    if orjson is not None:
+        return orjson.dumps(record) + b"\n"
+    return (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
 
 
 class SafetyGuard:
@@ -43,7 +76,7 @@ class SafetyGuard:
     - forbidden: 禁止执行，需要用户确认
     """
     
-    SAFE_OPERATIONS = {
+    SAFE_OPERATIONS = frozenset({
         "navigate", "read", "scroll", "screenshot", 
         "extract", "wait", "get_title", "get_url",
         "launch", "activate", "is_running", "list_apps",
@@ -52,76 +85,120 @@ class SafetyGuard:
         "submit", "select", "upload", "type",
         "hotkey", "clear_and_type", "click_at", "select_menu",
         "close"
-    }
+    })
     
-    FORBIDDEN_OPERATIONS = {
+    FORBIDDEN_OPERATIONS = frozenset({
         "payment", "delete", "modify_settings",
         "download_file", "execute_script", "install_extension"
-    }
+    })
     
-    NEED_CONFIRM_BUTTON_TEXT = {
+    NEED_CONFIRM_BUTTON_TEXT = frozenset({
         "发布", "发表", "公开", "publish",
         "发送消息", "发送给", "send message",
         "提交订单", "确认购买", "立即购买", "支付",
         "删除", "移除", "delete", "remove"
-    }
+    })
     
-    SAFE_BUTTON_TEXT = {
+    SAFE_BUTTON_TEXT = frozenset({
         "搜索", "查询", "找一下", "search", "query",
         "提交", "确定", "确认", "submit", "ok", "confirm",
         "登录", "注册", "login", "sign", "register",
         "下一步", "继续", "next", "continue",
         "刷新", "reload", "refresh"
-    }
+    })
     
-    FORBIDDEN_SELECTORS = {
+    FORBIDDEN_SELECTORS = frozenset({
         "payment", "checkout", "buy", "purchase", "pay",
         "delete", "remove", "trash",
         "settings", "config", "admin"
+    })
+    
+    _ACTION_DESCRIPTIONS = {
+        "click": "点击元素: {target}",
+        "fill": "在 {target} 中输入内容",
+        "login": "登录到网站",
+        "search": "搜索: {target}",
+        "submit": "提交表单: {target}",
+        "select": "选择选项: {target}",
+        "upload": "上传文件到: {target}"
     }
     
     MAX_URL_LENGTH = 2048
     MAX_INPUT_LENGTH = 10000
+    AUDIT_BUFFER_SIZE = 256
     
     def __init__(self, audit_log_path: str = "browser_agent/audit_logs"):
         self.audit_log_path = audit_log_path
         self.session_confirmations: Dict[str, bool] = {}
-        self.audit_logs: List[AuditLog] = []
+        # 完整审计记录实时追加到JSONL文件，内存中只保留最近的记录
+        self.audit_logs: Deque[AuditLog] = deque(maxlen=self.AUDIT_BUFFER_SIZE)
+        self._audit_fh = None
+        self._audit_file_path = os.path.join(
+            audit_log_path, time.strftime("audit_%Y%m%d_%H%M%S.jsonl")
+        )
+        
+        self._counts: Dict[OperationLevel, int] = {level: 0 for level in OperationLevel}
+        self._approved = 0
+        # 墙钟时间与单调时钟的差值，记录时只读单调时钟，需要展示时再换算
+        self._clock_offset = time.time() - time.monotonic()
         
         os.makedirs(audit_log_path, exist_ok=True)
     
+    @classmethod
+    def _compile_rules(cls):
+        """根据分级集合重建动作查找表和子串匹配正则，集合变更后需调用"""
+        action_level = {op: OperationLevel.SAFE for op in cls.SAFE_OPERATIONS}
+        action_level.update({op: OperationLevel.FORBIDDEN for op in cls.FORBIDDEN_OPERATIONS})
+        cls._ACTION_LEVEL = action_level
+        cls._FORBIDDEN_ACTION_RE = _compile_alternation(cls.FORBIDDEN_OPERATIONS)
+        cls._FORBIDDEN_SELECTOR_RE = _compile_alternation(cls.FORBIDDEN_SELECTORS)
+        cls._SAFE_BUTTON_RE = _compile_alternation(cls.SAFE_BUTTON_TEXT)
+        cls._CONFIRM_BUTTON_RE = _compile_alternation(cls.NEED_CONFIRM_BUTTON_TEXT)
+        cls._classify_cached.cache_clear()
+    
     def _should_confirm_button(self, target: str) -> bool:
         target_lower = target.lower()
         
-        for safe_text in self.SAFE_BUTTON_TEXT:
-            if safe_text.lower() in target_lower:
-                return False
-        
-        for sensitive_text in self.NEED_CONFIRM_BUTTON_TEXT:
-            if sensitive_text.lower() in target_lower:
-                return True
+        if self._SAFE_BUTTON_RE.search(target_lower):
+            return False
         
-        return False
+        return self._CONFIRM_BUTTON_RE.search(target_lower) is not None
     
-    def classify_operation(self, action: str, target: str = "", value: str = "") -> OperationLevel:
+    @classmethod
+    def _classify(cls, action: str, target: str) -> OperationLevel:
         action_lower = action.lower()
+        target_lower = target.lower()
         
-        if action_lower in self.FORBIDDEN_OPERATIONS:
+        if cls._ACTION_LEVEL.get(action_lower) is OperationLevel.FORBIDDEN:
             return OperationLevel.FORBIDDEN
         
-        for forbidden in self.FORBIDDEN_OPERATIONS:
-            if forbidden in action_lower:
-                return OperationLevel.FORBIDDEN
+        if cls._FORBIDDEN_ACTION_RE.search(action_lower):
+            return OperationLevel.FORBIDDEN
         
-        for selector in self.FORBIDDEN_SELECTORS:
-            if selector in target.lower():
-                return OperationLevel.FORBIDDEN
+        if cls._FORBIDDEN_SELECTOR_RE.search(target_lower):
+            return OperationLevel.FORBIDDEN
         
-        if self._should_confirm_button(target):
+        if cls._SAFE_BUTTON_RE.search(target_lower):
+            return OperationLevel.SAFE
+        
+        if cls._CONFIRM_BUTTON_RE.search(target_lower):
             return OperationLevel.CONFIRM_REQUIRED
         
         return OperationLevel.SAFE
     
+    @classmethod
+    @functools.lru_cache(maxsize=1024)
+    def _classify_cached(cls, action: str, target: str, value_too_long: bool) -> Tuple[OperationLevel, Dict[str, Any]]:
+        """
+        分级与输入校验只依赖参数和类级规则，按 (action, target, 输入是否超长) 缓存
+        
+        输入值可能是密码，不作为缓存键保存
+        """
+        return cls._classify(action, target), cls._validate_inputs(action, target, value_too_long)
+    
+    def classify_operation(self, action: str, target: str = "", value: str = "") -> OperationLevel:
+        return self._classify_cached(action, target, len(value) > self.MAX_INPUT_LENGTH)[0]
+    
     def check_operation(
         self, 
         action: str, 
@@ -130,9 +207,7 @@ class SafetyGuard:
         auto_confirm: bool = False,
         confirmation_callback: Optional[Callable] = None
     ) -> Dict[str, Any]:
-        level = self.classify_operation(action, target, value)
-        
-        validation_result = self._validate_inputs(action, target, value)
+        level, validation_result = self._classify_cached(action, target, len(value) > self.MAX_INPUT_LENGTH)
         if not validation_result["valid"]:
             return {
                 "allowed": False,
@@ -257,50 +332,27 @@ class SafetyGuard:
             "requires_confirmation": False
         }
     
-    def _validate_inputs(self, action: str, target: str, value: str) -> Dict[str, Any]:
-        if len(target) > self.MAX_URL_LENGTH:
-            return {"valid": False, "reason": f"目标长度超过限制 ({self.MAX_URL_LENGTH})"}
+    @classmethod
+    def _validate_inputs(cls, action: str, target: str, value_too_long: bool) -> Dict[str, Any]:
+        if len(target) > cls.MAX_URL_LENGTH:
+            return {"valid": False, "reason": f"目标长度超过限制 ({cls.MAX_URL_LENGTH})"}
         
-        if len(value) > self.MAX_INPUT_LENGTH:
-            return {"valid": False, "reason": f"输入值长度超过限制 ({self.MAX_INPUT_LENGTH})"}
+        if value_too_long:
+            return {"valid": False, "reason": f"输入值长度超过限制 ({cls.MAX_INPUT_LENGTH})"}
         
         if action.lower() == "navigate":
-            if target and not self._is_safe_url(target):
+            if target and not cls._is_safe_url(target):
                 return {"valid": False, "reason": "URL不安全或协议不被允许"}
         
         return {"valid": True}
     
-    def _is_safe_url(self, url: str) -> bool:
-        allowed_schemes = {"http", "https"}
-        dangerous_patterns = {
-            "javascript:", "data:", "vbscript:",
-            "file://", "ftp://"
-        }
-        
-        url_lower = url.lower().strip()
-        
-        for pattern in dangerous_patterns:
-            if url_lower.startswith(pattern):
-                return False
-        
-        if not any(url_lower.startswith(scheme + "://") for scheme in allowed_schemes):
-            if not url_lower.startswith("/") and not url_lower.startswith("."):
-                return False
-        
-        return True
+    @staticmethod
+    def _is_safe_url(url: str) -> bool:
+        return not _UNSAFE_URL_RE.match(url) and _SAFE_URL_RE.match(url) is not None
     
     def _generate_confirmation_message(self, action: str, target: str, value: str) -> str:
-        action_descriptions = {
-            "click": f"点击元素: {target}",
-            "fill": f"在 {target} 中输入内容",
-            "login": f"登录到网站",
-            "search": f"搜索: {target}",
-            "submit": f"提交表单: {target}",
-            "select": f"选择选项: {target}",
-            "upload": f"上传文件到: {target}"
-        }
-        
-        desc = action_descriptions.get(action.lower(), f"执行操作: {action}")
+        template = self._ACTION_DESCRIPTIONS.get(action.lower(), "执行操作: {action}")
+        desc = template.format(action=action, target=target)
         if value and len(value) < 100:
             desc += f" (内容: {value[:50]}...)" if len(value) > 50 else f" (内容: {value})"
         
@@ -315,62 +367,69 @@ class SafetyGuard:
         result: str
     ):
         log = AuditLog(
-            timestamp=datetime.now().isoformat(),
+            timestamp=self._clock_offset + time.monotonic(),
             action=action,
             target=target[:200],
-            level=level,
+            level=level.value,
             approved=approved,
             result=result
         )
         self.audit_logs.append(log)
+        
+        self._counts[level] += 1
+        if approved:
+            self._approved += 1
+        
+        self._get_audit_fh().write(_audit_line(log))
+    
+    def _get_audit_fh(self):
+        if self._audit_fh is None:
+            self._audit_fh = open(self._audit_file_path, 'ab', buffering=0)
+        return self._audit_fh
     
     def save_audit_logs(self, filename: str = None) -> str:
-        if not filename:
-            filename = f"audit_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        """
+        审计日志在记录时已实时写入JSONL文件，这里返回该文件路径
         
-        filepath = os.path.join(self.audit_log_path, filename)
+        指定filename时额外复制一份到审计目录下
+        """
+        self._get_audit_fh()
         
-        logs_data = [
-            {
-                "timestamp": log.timestamp,
-                "action": log.action,
-                "target": log.target,
-                "level": log.level.value,
-                "approved": log.approved,
-                "result": log.result,
-                "details": log.details
-            }
-            for log in self.audit_logs
-        ]
+        if not filename:
+            return self._audit_file_path
         
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(logs_data, f, ensure_ascii=False, indent=2)
+        filepath = os.path.join(self.audit_log_path, filename)
+        shutil.copyfile(self._audit_file_path, filepath)
         
         return filepath
     
     def get_session_summary(self) -> Dict[str, Any]:
-        if not self.audit_logs:
+        counts = self._counts
+        total = sum(counts.values())
+        if not total:
             return {"total_operations": 0}
         
-        safe_count = sum(1 for log in self.audit_logs if log.level == OperationLevel.SAFE)
-        confirmed_count = sum(1 for log in self.audit_logs if log.level == OperationLevel.CONFIRM_REQUIRED)
-        forbidden_count = sum(1 for log in self.audit_logs if log.level == OperationLevel.FORBIDDEN)
-        approved_count = sum(1 for log in self.audit_logs if log.approved)
-        
         return {
-            "total_operations": len(self.audit_logs),
-            "safe_operations": safe_count,
-            "confirmed_operations": confirmed_count,
-            "forbidden_attempts": forbidden_count,
-            "approved_operations": approved_count,
-            "approval_rate": approved_count / len(self.audit_logs) if self.audit_logs else 0
+            "total_operations": total,
+            "safe_operations": counts[OperationLevel.SAFE],
+            "confirmed_operations": counts[OperationLevel.CONFIRM_REQUIRED],
+            "forbidden_attempts": counts[OperationLevel.FORBIDDEN],
+            "approved_operations": self._approved,
+            "approval_rate": self._approved / total
         }
     
     def clear_session_confirmations(self):
         self.session_confirmations.clear()
     
     def add_safe_operation(self, operation: str):
-        self.SAFE_OPERATIONS.add(operation.lower())
+        cls = type(self)
+        cls.SAFE_OPERATIONS = cls.SAFE_OPERATIONS | {operation.lower()}
+        cls._compile_rules()
     
     def add_forbidden_operation(self, operation: str):
-        self.FORBIDDEN_OPERATIONS.add(operation.lower())
+        cls = type(self)
+        cls.FORBIDDEN_OPERATIONS = cls.FORBIDDEN_OPERATIONS | {operation.lower()}
+        cls._compile_rules()
+
+
+SafetyGuard._compile_rules()
@@ -11,15 +11,82 @@
 import os
 import json
 import base64
+import functools
 import hashlib
+import heapq
+import atexit
+import threading
+import weakref
+from collections import defaultdict
 from datetime import datetime, timedelta
-from typing import Dict, Optional, Any
+from typing import Dict, List, Optional, Any, Set, Tuple
 from dataclasses import dataclass, field
 from pathlib import Path
 import re
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-@dataclass
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+except ImportError:
+    AESGCM = None
+
+
+_DOMAIN_RE = re.compile(r'://([^/]+)')
+
+# AES-GCM 密文前缀版本号，无前缀（或解密校验失败）的视为旧版XOR密文
+_AEAD_VERSION = b"\x01"
+_NONCE_SIZE = 12
+
+
+def _json_default(obj):
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _dump_json(data: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, ensure_ascii=False, indent=2, default=_json_default).encode('utf-8')
+
+
+def _load_json(raw: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def _atomic_write(path: Path, payload: bytes):
+    """先一次性写入临时文件再原子替换，避免写入中断导致文件损坏"""
+    tmp_path = path.with_name(path.name + '.tmp')
+    tmp_path.write_bytes(payload)
+    os.replace(tmp_path, path)
+
+
+def _to_epoch(value: Optional[datetime]) -> Optional[int]:
+    return int(value.timestamp()) if value else None
+
+
+def _parse_datetime(value: Any) -> Optional[datetime]:
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value)
+    if isinstance(value, str):
+        # 兼容旧版以ISO字符串保存的时间
+        return datetime.fromisoformat(value)
+    return value
+
+
+@dataclass(slots=True)
 class SessionState:
     session_id: str
     site_domain: str
@@ -32,7 +99,7 @@ class SessionState:
     expires_at: Optional[datetime] = None
 
 
-@dataclass 
+@dataclass(slots=True)
 class Credential:
     site_domain: str
     username: str
@@ -42,6 +109,16 @@ class Credential:
     metadata: dict = field(default_factory=dict)
 
 
+# 所有存活的实例，退出时统一落盘；弱引用不会延长实例生命周期
+_LIVE_MANAGERS: "weakref.WeakSet[SessionManager]" = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_all_managers():
+    for manager in list(_LIVE_MANAGERS):
+        manager.flush()
+
+
 class SessionManager:
     """
     会话管理器
@@ -69,66 +146,132 @@ class SessionManager:
         self.session_dir.mkdir(parents=True, exist_ok=True)
         
         self.encryption_key = encryption_key or os.environ.get("NEO_BROWSER_KEY", "default-key-change-me")
+        self._key = self._derive_key(self.encryption_key)
+        self._key_arr = np.frombuffer(self._key, dtype=np.uint8) if np is not None else None
+        self._aead = AESGCM(self._key) if AESGCM is not None else None
         
         self.active_sessions: Dict[str, SessionState] = {}
+        # 域名 -> 会话ID，用字典作有序集合，保持与 active_sessions 一致的插入顺序
+        self._by_domain: Dict[str, Dict[str, None]] = defaultdict(dict)
+        self._expiry_heap: List[Tuple[datetime, str]] = []
+        # 磁盘上的会话按域名在首次访问时才加载
+        self._loaded_domains: Set[str] = set()
+        
+        # 会话更新只标记为脏，由后台定时器合并写盘
+        self._dirty: Set[str] = set()
+        self._flush_interval = 1.0
+        self._flush_timer: Optional[threading.Timer] = None
+        self._io_lock = threading.RLock()
+        _LIVE_MANAGERS.add(self)
         self.credentials: Dict[str, Credential] = {}
+        # 凭证文件存在但无法读取（密钥变化、缺少cryptography等）时，写入前先将其另存，避免覆盖丢失
+        self._credentials_unreadable = False
         
         self._load_credentials()
     
     def _derive_key(self, key: str) -> bytes:
         return hashlib.sha256(key.encode()).digest()
     
+    def _xor_with_key(self, data: bytes) -> bytes:
+        if self._key_arr is not None:
+            buf = np.frombuffer(data, dtype=np.uint8)
+            pad = np.resize(self._key_arr, buf.size)
+            return np.bitwise_xor(buf, pad).tobytes()
+        
+        key = self._key
+        return bytes(a ^ key[i % len(key)] for i, a in enumerate(data))
+    
     def _encrypt(self, data: str) -> str:
-        key = self._derive_key(self.encryption_key)
-        encoded = data.encode('utf-8')
-        xored = bytes(a ^ b for a, b in zip(encoded, key * (len(encoded) // len(key) + 1)))
+        if self._aead is not None:
+            nonce = os.urandom(_NONCE_SIZE)
+            sealed = _AEAD_VERSION + nonce + self._aead.encrypt(nonce, data.encode('utf-8'), None)
+            return base64.b64encode(sealed).decode('ascii')
+        
+        xored = self._xor_with_key(data.encode('utf-8'))
         return base64.b64encode(xored).decode('ascii')
     
+    def _decrypt_with_format(self, encrypted: str) -> Tuple[str, bool]:
+        """
+        解密并返回 (明文, 是否为旧版XOR密文)
+        """
+        raw = base64.b64decode(encrypted.encode('ascii'))
+        
+        if self._aead is not None and raw[:1] == _AEAD_VERSION and len(raw) > 1 + _NONCE_SIZE:
+            nonce = raw[1:1 + _NONCE_SIZE]
+            try:
+                return self._aead.decrypt(nonce, raw[1 + _NONCE_SIZE:], None).decode('utf-8'), False
+            except InvalidTag:
+                pass
+        
+        return self._xor_with_key(raw).decode('utf-8'), True
+    
     def _decrypt(self, encrypted: str) -> str:
-        key = self._derive_key(self.encryption_key)
-        encoded = base64.b64decode(encrypted.encode('ascii'))
-        xored = bytes(a ^ b for a, b in zip(encoded, key * (len(encoded) // len(key) + 1)))
-        return xored.decode('utf-8')
+        return self._decrypt_with_format(encrypted)[0]
     
-    def _get_domain_key(self, url: str) -> str:
-        match = re.search(r'://([^/]+)', url)
-        if match:
-            domain = match.group(1)
-            return domain.split('.')[-2] if len(domain.split('.')) > 1 else domain
-        return "default"
+    @staticmethod
+    @functools.lru_cache(maxsize=512)
+    def _get_domain_key(url: str) -> str:
+        match = _DOMAIN_RE.search(url)
+        if not match:
+            return "default"
+        host = match.group(1)
+        parts = host.rsplit('.', 2)
+        return parts[-2] if len(parts) > 1 else host
     
     def _get_session_file(self, session_id: str) -> Path:
         return self.session_dir / f"{session_id}.json"
     
     def create_session(self, site_url: str) -> SessionState:
         domain = self._get_domain_key(site_url)
-        session_id = f"{domain}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        now = datetime.now()
+        session_id = f"{domain}_{now.strftime('%Y%m%d_%H%M%S')}"
         
         session = SessionState(
             session_id=session_id,
             site_domain=domain,
-            created_at=datetime.now(),
-            last_active=datetime.now(),
-            expires_at=datetime.now() + timedelta(days=self.SESSION_EXPIRE_DAYS)
+            created_at=now,
+            last_active=now,
+            expires_at=now + timedelta(days=self.SESSION_EXPIRE_DAYS)
         )
         
-        self.active_sessions[session_id] = session
+        self._add_active_session(session)
         return session
     
+    def _add_active_session(self, session: SessionState):
+        self.active_sessions[session.session_id] = session
+        self._by_domain[session.site_domain][session.session_id] = None
+        if session.expires_at:
+            heapq.heappush(self._expiry_heap, (session.expires_at, session.session_id))
+    
+    def _ensure_domain_loaded(self, domain: str):
+        if domain in self._loaded_domains:
+            return
+        self._loaded_domains.add(domain)
+        
+        for session_file in self.session_dir.glob(f"{domain}_*.json"):
+            if session_file.stem not in self.active_sessions:
+                self.load_session(session_file.stem)
+    
     def get_session(self, session_id: str) -> Optional[SessionState]:
         session = self.active_sessions.get(session_id)
+        if session is None:
+            session = self.load_session(session_id)
         if session:
-            if session.expires_at and datetime.now() > session.expires_at:
+            now = datetime.now()
+            if session.expires_at and now > session.expires_at:
                 self.delete_session(session_id)
                 return None
-            session.last_active = datetime.now()
+            session.last_active = now
         return session
     
     def get_session_for_site(self, site_url: str) -> Optional[SessionState]:
         domain = self._get_domain_key(site_url)
-        for session in self.active_sessions.values():
-            if session.site_domain == domain and session.is_logged_in:
-                if session.expires_at and datetime.now() > session.expires_at:
+        self._ensure_domain_loaded(domain)
+        now = datetime.now()
+        for session_id in self._by_domain.get(domain, ()):
+            session = self.active_sessions[session_id]
+            if session.is_logged_in:
+                if session.expires_at and now > session.expires_at:
                     continue
                 return session
         return None
@@ -155,26 +298,50 @@ class SessionManager:
             session.username = username
         
         session.last_active = datetime.now()
-        self._save_session(session)
+        self._mark_dirty(session_id)
         return True
     
+    def _mark_dirty(self, session_id: str):
+        with self._io_lock:
+            self._dirty.add(session_id)
+            if self._flush_timer is None:
+                self._flush_timer = threading.Timer(self._flush_interval, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+    
+    def flush(self):
+        """将所有待写入的会话落盘，退出前应调用以确保不丢失更新"""
+        with self._io_lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            
+            # 会话目录已被删除时放弃写入
+            if not self.session_dir.is_dir():
+                return
+            
+            dirty, self._dirty = self._dirty, set()
+            for session_id in dirty:
+                session = self.active_sessions.get(session_id)
+                if session:
+                    self._save_session(session)
+    
     def _save_session(self, session: SessionState):
         session_file = self._get_session_file(session.session_id)
         
         data = {
             "session_id": session.session_id,
             "site_domain": session.site_domain,
-            "created_at": session.created_at.isoformat(),
-            "last_active": session.last_active.isoformat(),
+            "created_at": _to_epoch(session.created_at),
+            "last_active": _to_epoch(session.last_active),
             "cookies": session.cookies,
             "local_storage": session.local_storage,
             "is_logged_in": session.is_logged_in,
             "username": session.username,
-            "expires_at": session.expires_at.isoformat() if session.expires_at else None
+            "expires_at": _to_epoch(session.expires_at)
         }
         
-        with open(session_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        _atomic_write(session_file, _dump_json(data))
     
     def load_session(self, session_id: str) -> Optional[SessionState]:
         session_file = self._get_session_file(session_id)
@@ -182,26 +349,25 @@ class SessionManager:
             return None
         
         try:
-            with open(session_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            data = _load_json(session_file.read_bytes())
             
             session = SessionState(
                 session_id=data["session_id"],
                 site_domain=data["site_domain"],
-                created_at=datetime.fromisoformat(data["created_at"]),
-                last_active=datetime.fromisoformat(data["last_active"]),
+                created_at=_parse_datetime(data["created_at"]),
+                last_active=_parse_datetime(data["last_active"]),
                 cookies=data.get("cookies", []),
                 local_storage=data.get("local_storage", {}),
                 is_logged_in=data.get("is_logged_in", False),
                 username=data.get("username"),
-                expires_at=datetime.fromisoformat(data["expires_at"]) if data.get("expires_at") else None
+                expires_at=_parse_datetime(data.get("expires_at"))
             )
             
             if session.expires_at and datetime.now() > session.expires_at:
                 self.delete_session(session_id)
                 return None
             
-            self.active_sessions[session_id] = session
+            self._add_active_session(session)
             return session
             
         except Exception as e:
@@ -209,12 +375,19 @@ class SessionManager:
             return None
     
     def delete_session(self, session_id: str) -> bool:
-        if session_id in self.active_sessions:
-            del self.active_sessions[session_id]
+        session = self.active_sessions.pop(session_id, None)
+        if session:
+            domain_sessions = self._by_domain.get(session.site_domain)
+            if domain_sessions is not None:
+                domain_sessions.pop(session_id, None)
+                if not domain_sessions:
+                    del self._by_domain[session.site_domain]
         
-        session_file = self._get_session_file(session_id)
-        if session_file.exists():
-            session_file.unlink()
+        with self._io_lock:
+            self._dirty.discard(session_id)
+            session_file = self._get_session_file(session_id)
+            if session_file.exists():
+                session_file.unlink()
         
         return True
     
@@ -241,8 +414,13 @@ class SessionManager:
             return None
         
         try:
-            password = self._decrypt(credential.password_encrypted)
+            password, is_legacy = self._decrypt_with_format(credential.password_encrypted)
             credential.last_used = datetime.now()
+            
+            if is_legacy and self._aead is not None:
+                credential.password_encrypted = self._encrypt(password)
+                self._save_credentials()
+
             return {
                 "username": credential.username,
                 "password": password
@@ -261,34 +439,55 @@ class SessionManager:
                 "site_domain": cred.site_domain,
                 "username": cred.username,
                 "password_encrypted": cred.password_encrypted,
-                "created_at": cred.created_at.isoformat(),
-                "last_used": cred.last_used.isoformat() if cred.last_used else None,
+                "created_at": _to_epoch(cred.created_at),
+                "last_used": _to_epoch(cred.last_used),
                 "metadata": cred.metadata
             }
         
-        with open(self.credentials_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        payload = _dump_json(data)
+        if self._aead is not None:
+            nonce = os.urandom(_NONCE_SIZE)
+            payload = _AEAD_VERSION + nonce + self._aead.encrypt(nonce, payload, None)
+        
+        if self._credentials_unreadable and self.credentials_file.exists():
+            backup = self.credentials_file.with_name(
+                f"{self.credentials_file.name}.unreadable-{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+            )
+            os.replace(self.credentials_file, backup)
+            print(f"[SessionManager] 原凭证文件无法读取，已另存为: {backup}")
+        self._credentials_unreadable = False
+        
+        _atomic_write(self.credentials_file, payload)
     
     def _load_credentials(self):
         if not self.credentials_file.exists():
             return
         
         try:
-            with open(self.credentials_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            raw = self.credentials_file.read_bytes()
+            # 旧版凭证文件为明文JSON，新版为整体AES-GCM加密的二进制数据
+            if raw[:1] == _AEAD_VERSION:
+                if self._aead is None:
+                    raise RuntimeError("凭证文件已加密，需要安装cryptography才能读取")
+                nonce = raw[1:1 + _NONCE_SIZE]
+                raw = self._aead.decrypt(nonce, raw[1 + _NONCE_SIZE:], None)
+            
+            data = _load_json(raw)
             
             for domain, cred_data in data.items():
                 credential = Credential(
                     site_domain=cred_data["site_domain"],
                     username=cred_data["username"],
                     password_encrypted=cred_data["password_encrypted"],
-                    created_at=datetime.fromisoformat(cred_data["created_at"]),
-                    last_used=datetime.fromisoformat(cred_data["last_used"]) if cred_data.get("last_used") else None,
+                    created_at=_parse_datetime(cred_data["created_at"]),
+                    last_used=_parse_datetime(cred_data.get("last_used")),
                     metadata=cred_data.get("metadata", {})
                 )
                 self.credentials[domain] = credential
                 
         except Exception as e:
+            self.credentials.clear()
+            self._credentials_unreadable = True
             print(f"[SessionManager] 加载凭证失败: {e}")
     
     def delete_credentials(self, site_url: str) -> bool:
@@ -300,23 +499,33 @@ class SessionManager:
         return False
     
     def list_saved_sites(self) -> list:
+        for domain in self.credentials:
+            self._ensure_domain_loaded(domain)
+        
         return [
             {
                 "domain": domain,
                 "username": cred.username,
-                "has_session": any(s.site_domain == domain and s.is_logged_in for s in self.active_sessions.values()),
+                "has_session": any(
+                    self.active_sessions[sid].is_logged_in for sid in self._by_domain.get(domain, ())
+                ),
                 "last_used": cred.last_used.isoformat() if cred.last_used else None
             }
             for domain, cred in self.credentials.items()
         ]
     
     def cleanup_expired_sessions(self) -> int:
-        expired = []
-        for session_id, session in self.active_sessions.items():
-            if session.expires_at and datetime.now() > session.expires_at:
-                expired.append(session_id)
+        now = datetime.now()
+        heap = self._expiry_heap
+        count = 0
         
-        for session_id in expired:
+        while heap and heap[0][0] < now:
+            expires_at, session_id = heapq.heappop(heap)
+            session = self.active_sessions.get(session_id)
+            # 会话已删除或过期时间已变更的堆条目直接丢弃
+            if session is None or session.expires_at != expires_at:
+                continue
             self.delete_session(session_id)
+            count += 1
         
-        return len(expired)
+        return count
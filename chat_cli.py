@@ -7,11 +7,17 @@ Neo 命令行界面 - 基于 ReAct 架构
 
 import sys
 import json
-from typing import Optional, Dict, Any, List
+import time
+import queue
+import atexit
+import threading
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, Deque
 from rich.console import Console
 from rich.panel import Panel
 from rich.prompt import Prompt
-from rich.markdown import Markdown
 from rich.status import Status
 from rich.table import Table
 from rich import print as rprint
@@ -22,6 +28,11 @@ from tools.soul_skill import SoulSkill
 
 console = Console()
 
+CONTEXT_MAXLEN = 20
+MEMORY_BATCH_SIZE = 10
+MEMORY_FLUSH_IDLE = 5.0
+_FLUSH = object()
+
 
 def print_banner(skill_names: List[str]):
     console.print(Panel.fit(
@@ -57,20 +68,31 @@ def print_help():
     console.print()
 
 
+_skill_table_cache: Optional[Table] = None
+_skill_table_key: Optional[tuple] = None
+
+
 def print_skills(skill_manager: SkillManager):
-    skills = skill_manager.list_skills()
+    global _skill_table_cache, _skill_table_key
     
-    table = Table(title=f"🔧 已加载技能 ({len(skills)} 个)")
-    table.add_column("技能名称", style="cyan")
-    table.add_column("描述", style="white")
+    skills = skill_manager.list_skills()
+    key = tuple(skills)
     
-    for skill_name in skills:
-        info = skill_manager.get_skill_info(skill_name)
-        if info:
-            desc = info["schema"].get("function", {}).get("description", "")[:60]
-            table.add_row(skill_name, desc + "...")
+    if _skill_table_cache is None or key != _skill_table_key:
+        table = Table(title=f"🔧 已加载技能 ({len(skills)} 个)")
+        table.add_column("技能名称", style="cyan")
+        table.add_column("描述", style="white")
+        
+        for skill_name in skills:
+            info = skill_manager.get_skill_info(skill_name)
+            if info:
+                desc = info["schema"].get("function", {}).get("description", "")[:60]
+                table.add_row(skill_name, desc + "...")
+        
+        _skill_table_cache = table
+        _skill_table_key = key
     
-    console.print(table)
+    console.print(_skill_table_cache)
 
 
 def print_memory_stats(memory: VectorMemory):
@@ -132,10 +154,48 @@ def on_log(log_type: str, data: dict):
         console.print(f"[dim]{status} 工具结果: {data.get('tool')}[/]")
 
 
-def render_result(result: Dict[str, Any], show_trace: bool = False, show_logs: bool = False, logs: List = None):
+class StreamRenderer:
+    """流式渲染 LLM 回复：首个 token 到达即开始显示，每轮思考重新开始"""
+    
+    def __init__(self):
+        self.buffer = ""
+        self.live = None
+        self._markdown = None
+    
+    def __call__(self, delta: str):
+        self.buffer += delta
+        if self.live is None:
+            # Markdown 渲染依赖较重，首次输出时才导入
+            from rich.live import Live
+            from rich.markdown import Markdown
+            
+            self._markdown = Markdown
+            console.print()
+            self.live = Live(Markdown(""), console=console, refresh_per_second=12)
+            self.live.start()
+        self.live.update(self._markdown(self.buffer))
+    
+    def reset(self):
+        self.stop()
+        self.live = None
+        self.buffer = ""
+    
+    def stop(self):
+        if self.live is not None:
+            self.live.stop()
+    
+    @property
+    def streamed(self) -> bool:
+        return self.live is not None
+
+
+def render_result(result: Dict[str, Any], show_trace: bool = False, show_logs: bool = False, logs: List = None,
+                  streamed: bool = False):
     if result["success"]:
-        console.print()
-        console.print(Markdown(result["response"]))
+        if not streamed:
+            from rich.markdown import Markdown
+            console.print()
+            console.print(Markdown(result["response"]))
         
         if show_trace and result.get("trace"):
             console.print("\n[dim]📋 执行轨迹:[/]")
@@ -159,6 +219,47 @@ def render_result(result: Dict[str, Any], show_trace: bool = False, show_logs: b
         console.print(f"\n[red]❌ {result['response']}[/]")
 
 
+def _format_recent_chat(context: Deque[Dict[str, str]], max_turns: int = 10) -> str:
+    lines = []
+    for msg in list(context)[-max_turns * 2:]:
+        speaker = "User" if msg["role"] == "user" else "AI"
+        lines.append(f"{speaker}: {msg['content'][:500]}")
+    return "\n".join(lines)
+
+
+def _background_compress(memory: VectorMemory, soul: SoulSkill, client: LLMClient, recent_chat: str, in_flight: threading.Event):
+    try:
+        memory.compress(client)
+        soul.reflect_and_evolve(recent_chat, client)
+    except Exception:
+        traceback.print_exc()
+    finally:
+        in_flight.clear()
+
+
+def _memory_writer(memory: VectorMemory, mem_queue: "queue.Queue"):
+    """后台写入交互记录：攒满一批或空闲一段时间后整批落盘"""
+    batch = []
+    running = True
+    while running:
+        try:
+            item = mem_queue.get(timeout=MEMORY_FLUSH_IDLE if batch else None)
+        except queue.Empty:
+            item = _FLUSH
+        
+        if item is None:
+            running = False
+        elif item is not _FLUSH:
+            batch.append(item)
+        
+        if batch and (item is None or item is _FLUSH or len(batch) >= MEMORY_BATCH_SIZE):
+            try:
+                memory.record_batch(batch)
+            except Exception:
+                traceback.print_exc()
+            batch = []
+
+
 def main():
     with Status("[bold green]正在初始化核心系统...[/]", spinner="dots"):
         client = LLMClient()
@@ -171,11 +272,28 @@ def main():
     skill_names = skill_manager.list_skills()
     print_banner(skill_names)
     
-    messages: List[Dict[str, str]] = []
+    # Agent 只取最近 10 条上下文，反思取最近 10 轮，超出部分无需保留
+    context: Deque[Dict[str, str]] = deque(maxlen=CONTEXT_MAXLEN)
     interaction_count = 0
     show_trace = False
     show_logs = False
     current_logs = []
+    # 交互记录经队列批量写盘；压缩和灵魂反思在另一个后台线程执行，均不阻塞输入
+    mem_queue: "queue.Queue" = queue.Queue()
+    mem_writer = threading.Thread(
+        target=_memory_writer, args=(memory, mem_queue), name="neo-memory-writer", daemon=True
+    )
+    mem_writer.start()
+    memory_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="neo-memory")
+    compress_in_flight = threading.Event()
+    atexit.register(memory_executor.shutdown, wait=True)
+    
+    command_handlers = {
+        "help": print_help,
+        "skills": lambda: print_skills(skill_manager),
+        "memory": lambda: print_memory_stats(memory),
+        "status": print_code_guard_status,
+    }
     
     while True:
         try:
@@ -184,47 +302,34 @@ def main():
             if not user_input:
                 continue
             
-            if user_input.lower() in ["quit", "exit"]:
+            cmd = user_input.lower()
+            
+            if cmd in ("quit", "exit"):
                 console.print("[magenta]👋 再见！[/]")
                 break
             
-            if user_input.lower() == "help":
-                print_help()
+            handler = command_handlers.get(cmd)
+            if handler:
+                handler()
                 continue
             
-            if user_input.lower() == "skills":
-                print_skills(skill_manager)
-                continue
-            
-            if user_input.lower() == "memory":
-                print_memory_stats(memory)
-                continue
-            
-            if user_input.lower() == "clear":
-                messages = []
+            if cmd == "clear":
+                context.clear()
                 console.print("[green]✅ 对话历史已清空[/]")
                 continue
             
-            if user_input.lower() == "status":
-                print_code_guard_status()
-                continue
-            
-            if user_input.lower() == "trace":
+            if cmd == "trace":
                 show_trace = not show_trace
                 status = "开启" if show_trace else "关闭"
                 console.print(f"[green]✅ 执行轨迹显示已{status}[/]")
                 continue
             
-            if user_input.lower() == "logs":
+            if cmd == "logs":
                 show_logs = not show_logs
                 status = "开启" if show_logs else "关闭"
                 console.print(f"[green]✅ LLM日志显示已{status}[/]")
                 continue
             
-            messages.append({"role": "user", "content": user_input})
-            
-            context = [m for m in messages[:-1] if m["role"] in ["user", "assistant"]]
-            
             console.print("[dim]🧠 正在思考...[/]")
             
             current_logs = []
@@ -234,39 +339,61 @@ def main():
                 if show_logs:
                     on_log(log_type, data)
             
-            result = agent.run(user_input, context=context, on_progress=on_progress, on_log=collect_logs)
+            renderer = StreamRenderer()
             
-            render_result(result, show_trace=show_trace, show_logs=show_logs, logs=current_logs)
+            def progress(stage: str, message: str):
+                if stage == "thinking":
+                    renderer.reset()
+                on_progress(stage, message)
             
+            try:
+                result = agent.run(
+                    user_input, context=context, on_progress=progress, on_log=collect_logs, on_token=renderer
+                )
+            finally:
+                renderer.stop()
+            
+            render_result(
+                result, show_trace=show_trace, show_logs=show_logs, logs=current_logs,
+                streamed=renderer.streamed and result["success"]
+            )
+            
+            context.append({"role": "user", "content": user_input})
             if result["success"]:
-                messages.append({"role": "assistant", "content": result["response"]})
+                context.append({"role": "assistant", "content": result["response"]})
             else:
-                messages.append({"role": "assistant", "content": f"任务执行失败: {result['response']}"})
+                context.append({"role": "assistant", "content": f"任务执行失败: {result['response']}"})
             
-            memory.add_interaction(
-                user_input=user_input,
-                assistant_response=result["response"],
-                tool_calls=[{"name": t["tool"], "args": t["args"]} for t in result.get("trace", [])]
-            )
+            mem_queue.put((
+                user_input,
+                result["response"],
+                [{"name": t["tool"], "args": t["args"]} for t in result.get("trace", [])],
+                time.time()
+            ))
             
             interaction_count += 1
             
-            if interaction_count % 10 == 0:
-                console.print("[dim]🧘 正在压缩记忆...[/]")
-                memory.compress(client)
-                
-                recent_chat = memory.get_context_for_prompt("最近的对话")
-                soul.reflect_and_evolve(recent_chat, client)
+            if interaction_count % 10 == 0 and not compress_in_flight.is_set():
+                compress_in_flight.set()
+                mem_queue.put(_FLUSH)
+                console.print("[dim]🧘 正在后台压缩记忆...[/]")
+                memory_executor.submit(
+                    _background_compress, memory, soul, client, _format_recent_chat(context), compress_in_flight
+                )
         
         except KeyboardInterrupt:
+            mem_queue.put(_FLUSH)
             console.print("\n[bold red]⚠️ 强制中断[/]")
             console.print("[dim]输入 'quit' 退出程序[/]")
             continue
         
         except Exception as e:
             console.print(f"\n[bold red]❌ 错误:[/] {e}")
-            import traceback
             traceback.print_exc()
+    
+    mem_queue.put(None)
+    mem_writer.join()
+    memory_executor.shutdown(wait=True)
 
 
 if __name__ == "__main__":
@@ -11,14 +11,67 @@
 
 import os
 import re
+import time
 import shutil
 import hashlib
+import threading
 from datetime import datetime
+from collections import OrderedDict
 from typing import Dict, List, Optional, Any, Tuple
 from dataclasses import dataclass, field
 from pathlib import Path
 from enum import Enum
 
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+try:
+    import hyperscan
+except ImportError:
+    hyperscan = None
+
+
+def _build_literal_automaton(literals: List[str]):
+    """将字面量构建为 Aho-Corasick 自动机，一遍扫描得到所有命中的模式下标"""
+    if ahocorasick is None:
+        return None
+    
+    positions: Dict[str, List[int]] = {}
+    for i, literal in enumerate(literals):
+        positions.setdefault(literal, []).append(i)
+    
+    automaton = ahocorasick.Automaton()
+    for literal, indexes in positions.items():
+        automaton.add_word(literal, tuple(indexes))
+    automaton.make_automaton()
+    return automaton
+
+
+def _build_hyperscan_db(patterns: List[str]):
+    """用 Hyperscan 编译全部模式，一遍扫描即可得到每个模式是否命中"""
+    if hyperscan is None:
+        return None
+    
+    try:
+        db = hyperscan.Database()
+        db.compile(
+            expressions=[p.encode("utf-8") for p in patterns],
+            ids=list(range(len(patterns))),
+            elements=len(patterns),
+            flags=[hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_SINGLEMATCH] * len(patterns),
+        )
+        return db
+    except Exception:
+        # 个别语法不受支持时整体回退到 re
+        return None
+
 
 class ModificationLevel(Enum):
     NONE = "none"
@@ -84,12 +137,13 @@ class CodeGuard:
         r'__import__\s*\(',
         r'compile\s*\([^)]*,\s*[\'"]exec[\'"]',
         r'open\s*\([^)]*,\s*[\'"]w[\'"]\s*\).*\.\w+system',
-        r'FORBIDDEN_OPERATIONS\s*=\s*\{[\s}]*\}',
-        r'SAFE_OPERATIONS\s*=\s*\{[^}]*\*[^}]*\}',
+        # 自我保护规则只匹配语句开头（行首、分号或冒号后，可带属性前缀）的赋值
+        r'(?m:(?:^|[;:])\s*(?:[\w.]+\.)?FORBIDDEN_OPERATIONS\s*=\s*(frozenset\(\s*(\{[\s}]*\}\s*)?\)|\{[\s}]*\}))',
+        r'(?m:(?:^|[;:])\s*(?:[\w.]+\.)?SAFE_OPERATIONS\s*=\s*(frozenset\(\s*)?\{[^}]*\*[^}]*\})',
         r'classify_operation.*return\s+OperationLevel\.SAFE',
-        r'PROTECTED_FILES\s*=\s*\{[\s}]*\}',
-        r'PROTECTED_DIRECTORIES\s*=\s*\{[\s}]*\}',
-        r'DANGEROUS_PATTERNS\s*=\s*\[\s*\]',
+        r'(?m:(?:^|[;:])\s*(?:[\w.]+\.)?PROTECTED_FILES\s*=\s*\{[\s}]*\})',
+        r'(?m:(?:^|[;:])\s*(?:[\w.]+\.)?PROTECTED_DIRECTORIES\s*=\s*\{[\s}]*\})',
+        r'(?m:(?:^|[;:])\s*(?:[\w.]+\.)?DANGEROUS_PATTERNS\s*=\s*\[\s*\])',
         r'CodeGuard',
         r'ModificationLevel',
     ]
@@ -106,6 +160,58 @@ class CodeGuard:
         r'ftplib',
     ]
     
+    # 与上面模式一一对应的小写字面量，代码中不含该字面量时对应模式不可能命中
+    DANGEROUS_LITERALS = [
+        "os.system",
+        "os.system",
+        "subprocess.",
+        "eval",
+        "exec",
+        "__import__",
+        "compile",
+        "open",
+        "forbidden_operations",
+        "safe_operations",
+        "classify_operation",
+        "protected_files",
+        "protected_directories",
+        "dangerous_patterns",
+        "codeguard",
+        "modificationlevel",
+    ]
+    
+    SUSPICIOUS_LITERALS = [
+        "curl",
+        "wget",
+        "requests.",
+        "base64.b64decode",
+        "pickle.loads",
+        "marshal.loads",
+        "socket.socket",
+        "telnetlib",
+        "ftplib",
+    ]
+    
+    # 类加载时预编译，检测时直接调用 .search
+    _DANGEROUS_RE = [(p, re.compile(p, re.IGNORECASE)) for p in DANGEROUS_PATTERNS]
+    _SUSPICIOUS_RE = [(p, re.compile(p, re.IGNORECASE)) for p in SUSPICIOUS_PATTERNS]
+    
+    _DANGEROUS_AC = _build_literal_automaton(DANGEROUS_LITERALS)
+    _SUSPICIOUS_AC = _build_literal_automaton(SUSPICIOUS_LITERALS)
+    
+    _DANGEROUS_HS = _build_hyperscan_db(DANGEROUS_PATTERNS)
+    _SUSPICIOUS_HS = _build_hyperscan_db(SUSPICIOUS_PATTERNS)
+    # Hyperscan 的 scratch 空间不能被并发扫描共享
+    _HS_LOCK = threading.Lock()
+    
+    # 所有模式合并为一个带命名分组的交替式，单遍扫描即可得到命中的模式
+    _DANGEROUS_UNION = re.compile(
+        "|".join(f"(?P<p{i}>{p})" for i, p in enumerate(DANGEROUS_PATTERNS)), re.IGNORECASE
+    )
+    _SUSPICIOUS_UNION = re.compile(
+        "|".join(f"(?P<p{i}>{p})" for i, p in enumerate(SUSPICIOUS_PATTERNS)), re.IGNORECASE
+    )
+    
     def __init__(
         self,
         base_dir: str = None,
@@ -119,6 +225,18 @@ class CodeGuard:
         self.backup_dir.mkdir(parents=True, exist_ok=True)
         
         self.modification_log: List[ModificationRecord] = []
+        # 绝对路径 -> (mtime_ns, size, checksum)，文件未变化时直接复用
+        self._checksum_cache: Dict[str, Tuple[int, int, str]] = {}
+        
+        # (检测类型, 代码) -> 命中的模式；同一段代码在创建/审批/执行链路上会被重复检测
+        self._scan_results: "OrderedDict[Tuple[str, str], Tuple[str, ...]]" = OrderedDict()
+        
+        self._base_abs = os.path.abspath(self.base_dir)
+        self._rel_path_cache: Dict[str, str] = {}
+        self._protected_prefixes = tuple(d + "/" for d in self.PROTECTED_DIRECTORIES)
+        self._sandbox_prefixes = tuple(
+            d + sep for d in self.SANDBOX_DIRECTORIES for sep in ("/", "\\")
+        )
         self.log_file = self.backup_dir / "modification_log.json"
         
         self._load_log()
@@ -153,20 +271,52 @@ class CodeGuard:
         except Exception:
             pass
     
+    @staticmethod
+    def _digest_bytes(data: bytes) -> str:
+        if blake3 is not None:
+            return blake3.blake3(data).hexdigest()
+        return hashlib.blake2b(data).hexdigest()
+    
     def _get_checksum(self, file_path: str) -> str:
         try:
-            with open(file_path, 'rb') as f:
-                return hashlib.md5(f.read()).hexdigest()
+            abs_path = os.path.abspath(file_path)
+            st = os.stat(abs_path)
+            cached = self._checksum_cache.get(abs_path)
+            if cached and cached[:2] == (st.st_mtime_ns, st.st_size):
+                return cached[2]
+            
+            checksum = self._hash_file(abs_path)
+            self._checksum_cache[abs_path] = (st.st_mtime_ns, st.st_size, checksum)
+            return checksum
         except Exception:
             return ""
     
+    @staticmethod
+    def _hash_file(file_path: str) -> str:
+        if blake3 is not None:
+            h = blake3.blake3()
+            h.update_mmap(file_path)
+            return h.hexdigest()
+        with open(file_path, 'rb') as f:
+            if hasattr(hashlib, "file_digest"):
+                return hashlib.file_digest(f, 'blake2b').hexdigest()
+            
+            # Python < 3.11：按固定大小分块读取，避免一次性读入整个文件
+            h = hashlib.blake2b()
+            while chunk := f.read(1 << 16):
+                h.update(chunk)
+            return h.hexdigest()
+    
     def _backup_file(self, file_path: str) -> str:
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = os.path.basename(file_path)
-        backup_name = f"{filename}.{timestamp}.bak"
+        timestamp = time.strftime('%Y%m%d_%H%M%S')
+        backup_name = f"{Path(file_path).name}.{timestamp}.bak"
         backup_path = self.backup_dir / backup_name
         
-        shutil.copy2(file_path, backup_path)
+        # execute_modification 通过 os.replace 换入新文件，原 inode 只剩备份引用，可直接硬链接
+        try:
+            os.link(file_path, backup_path)
+        except OSError:
+            shutil.copy2(file_path, backup_path)
         
         return str(backup_path)
     
@@ -176,45 +326,99 @@ class CodeGuard:
         if rel_path in self.PROTECTED_FILES:
             return True
         
-        for protected_dir in self.PROTECTED_DIRECTORIES:
-            if rel_path.startswith(protected_dir + "/"):
-                return True
-        
-        return False
+        return rel_path.startswith(self._protected_prefixes)
     
     def is_sandbox(self, file_path: str) -> bool:
-        rel_path = self._get_relative_path(file_path)
-        
-        for sandbox_dir in self.SANDBOX_DIRECTORIES:
-            if rel_path.startswith(sandbox_dir + "/") or rel_path.startswith(sandbox_dir + "\\"):
-                return True
-        
-        return False
+        return self._get_relative_path(file_path).startswith(self._sandbox_prefixes)
     
     def _get_relative_path(self, file_path: str) -> str:
+        # 相对路径依赖当前工作目录，按绝对路径缓存
         abs_path = os.path.abspath(file_path)
-        base_abs = os.path.abspath(self.base_dir)
-        
-        if abs_path.startswith(base_abs):
-            return os.path.relpath(abs_path, base_abs)
-        
-        return file_path
+        rel_path = self._rel_path_cache.get(abs_path)
+        if rel_path is not None:
+            return rel_path
+        
+        if not abs_path.startswith(self._base_abs):
+            return file_path
+        
+        rel_path = os.path.relpath(abs_path, self._base_abs)
+        if len(self._rel_path_cache) >= 1024:
+            self._rel_path_cache.clear()
+        self._rel_path_cache[abs_path] = rel_path
+        return rel_path
+    
+    @staticmethod
+    def _scan_patterns(
+        union: "re.Pattern",
+        compiled: List[Tuple[str, "re.Pattern"]],
+        literals: List[str],
+        automaton,
+        hs_db,
+        code: str
+    ) -> List[str]:
+        # 非 ASCII 文本在 IGNORECASE 下存在特殊大小写映射，不做字面量预筛
+        if code.isascii():
+            lowered = code.lower()
+            if automaton is not None:
+                candidates = set()
+                for _, indexes in automaton.iter(lowered):
+                    candidates.update(indexes)
+            else:
+                candidates = {i for i, literal in enumerate(literals) if literal in lowered}
+            if not candidates:
+                return []
+            
+            # ASCII 文本下 Hyperscan 的 CASELESS 与 re.IGNORECASE 一致，且会报告重叠命中
+            if hs_db is not None:
+                hits = set()
+                with CodeGuard._HS_LOCK:
+                    hs_db.scan(
+                        code.encode("utf-8"),
+                        match_event_handler=lambda pattern_id, start, end, flags, context: hits.add(pattern_id)
+                    )
+                return [pattern for i, (pattern, _) in enumerate(compiled) if i in hits]
+        else:
+            candidates = set(range(len(compiled)))
+        
+        hits = {int(m.lastgroup[1:]) for m in union.finditer(code)}
+        if not hits:
+            return []
+        
+        # 交替式在同一位置只报告最先匹配的分支，重叠的其他模式需单独确认
+        return [
+            pattern for i, (pattern, regex) in enumerate(compiled)
+            if i in hits or (i in candidates and regex.search(code))
+        ]
+    
+    def _cached_scan(self, kind: str, code: str, scan) -> Tuple[str, ...]:
+        key = (kind, code)
+        result = self._scan_results.get(key)
+        if result is None:
+            result = tuple(scan())
+            self._scan_results[key] = result
+            if len(self._scan_results) > 32:
+                self._scan_results.popitem(last=False)
+        return result
     
     def check_dangerous_code(self, code: str) -> Tuple[bool, List[str]]:
-        dangers = []
-        
-        for pattern in self.DANGEROUS_PATTERNS:
-            if re.search(pattern, code, re.IGNORECASE):
-                dangers.append(f"危险模式: {pattern}")
+        dangers = [
+            f"危险模式: {pattern}"
+            for pattern in self._cached_scan("dangerous", code, lambda: self._scan_patterns(
+                self._DANGEROUS_UNION, self._DANGEROUS_RE, self.DANGEROUS_LITERALS,
+                self._DANGEROUS_AC, self._DANGEROUS_HS, code
+            ))
+        ]
         
         return len(dangers) > 0, dangers
     
     def check_suspicious_code(self, code: str) -> Tuple[bool, List[str]]:
-        warnings = []
-        
-        for pattern in self.SUSPICIOUS_PATTERNS:
-            if re.search(pattern, code, re.IGNORECASE):
-                warnings.append(f"可疑模式: {pattern}")
+        warnings = [
+            f"可疑模式: {pattern}"
+            for pattern in self._cached_scan("suspicious", code, lambda: self._scan_patterns(
+                self._SUSPICIOUS_UNION, self._SUSPICIOUS_RE, self.SUSPICIOUS_LITERALS,
+                self._SUSPICIOUS_AC, self._SUSPICIOUS_HS, code
+            ))
+        ]
         
         return len(warnings) > 0, warnings
     
@@ -387,10 +591,19 @@ class CodeGuard:
             
             os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
             
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(new_code)
+            data = new_code.encode('utf-8')
+            tmp_path = f"{file_path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            if backup_path:
+                shutil.copymode(file_path, tmp_path)
+            os.replace(tmp_path, file_path)
             
-            checksum_after = self._get_checksum(file_path)
+            # 内容已在内存中，直接计算写入后的校验和，无需回读文件
+            checksum_after = self._digest_bytes(data)
+            abs_path = os.path.abspath(file_path)
+            st = os.stat(abs_path)
+            self._checksum_cache[abs_path] = (st.st_mtime_ns, st.st_size, checksum_after)
             
             record = ModificationRecord(
                 timestamp=datetime.now().isoformat(),
@@ -430,7 +643,9 @@ class CodeGuard:
             record = self.modification_log.pop()
             
             if record.backup_path and os.path.exists(record.backup_path):
-                shutil.copy2(record.backup_path, record.file_path)
+                # 文件内容已与备份一致时无需再复制
+                if self._get_checksum(record.file_path) != record.checksum_before:
+                    shutil.copy2(record.backup_path, record.file_path)
                 rolled_back.append(record.file_path)
         
         self._save_log()
@@ -0,0 +1,81 @@
+"""
+JSON 工具 - 统一的序列化与 LLM 输出解析
+
+特性:
+1. 安装 orjson 时使用 orjson 加速，否则回退到标准库
+2. 从 LLM 回复中提取第一个完整的 JSON 对象
+"""
+
+import json
+from typing import Any, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(data) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj: Any) -> str:
+    """序列化为 JSON 字符串（保留中文），orjson 无法处理的对象回退到标准库"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY).decode("utf-8")
+        except TypeError:
+            pass
+    return json.dumps(obj, ensure_ascii=False, default=str)
+
+
+def _find_object_end(raw: str, start: int) -> int:
+    depth = 0
+    in_string = False
+    escaped = False
+    for i in range(start, len(raw)):
+        ch = raw[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                return i
+    return -1
+
+
+def extract_json(raw: str) -> Optional[Any]:
+    """
+    从 LLM 输出中提取第一个完整的 JSON 对象
+
+    单遍扫描定位匹配的花括号，无需先剥离 ```json 代码块或标签；
+    存在 ```json 代码块时从代码块处开始扫描，跳过前面说明文字中的花括号
+    """
+    if not raw:
+        return None
+
+    fence = raw.find("```json")
+    start = raw.find("{", fence) if fence != -1 else -1
+    if start == -1:
+        start = raw.find("{")
+    while start != -1:
+        end = _find_object_end(raw, start)
+        if end == -1:
+            return None
+        chunk = raw[start:end + 1]
+        try:
+            return loads(chunk)
+        except ValueError:
+            start = raw.find("{", start + 1)
+    return None
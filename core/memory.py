@@ -1,9 +1,38 @@
 import os
 import json
 import time
+import heapq
+import atexit
 import hashlib
-from typing import List, Dict, Any, Optional
+import threading
+import weakref
+from typing import List, Dict, Any, Optional, Set, Tuple
 from collections import OrderedDict
+from core.json_utils import loads, dumps
+
+_STOP_WORDS = frozenset({"的", "是", "在", "了", "和", "与", "或", "有", "这", "那", "我", "你", "他", "她", "它"})
+_PUNCT_TRANS = str.maketrans({c: " " for c in "，。！？、：''()（）[]【】"})
+
+# 内容字符二元组位图的宽度；关键词的二元组未全部出现在位图中时必然不是子串
+_BLOOM_BITS = 1024
+
+
+def _bigram_mask(text: str) -> int:
+    mask = 0
+    for i in range(len(text) - 1):
+        mask |= 1 << (hash(text[i:i + 2]) & (_BLOOM_BITS - 1))
+    return mask
+
+
+# 所有存活的实例，退出时统一落盘；弱引用不会延长实例生命周期
+_LIVE_MEMORIES: "weakref.WeakSet[VectorMemory]" = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_all_memories():
+    for memory in list(_LIVE_MEMORIES):
+        memory.flush()
+
 
 class VectorMemory:
     """
@@ -16,19 +45,40 @@ class VectorMemory:
     4. 记忆压缩: 自动总结和精简
     """
     
+    # add() 累积到一定条数立即写盘，否则由定时器在一定时间后写盘
+    FLUSH_EVERY = 10
+    FLUSH_INTERVAL = 5.0
+    
     def __init__(self, root_dir: str = "./memory", max_short_term: int = 20):
         self.root_dir = root_dir
         self.max_short_term = max_short_term
         
         self.short_term_memory = OrderedDict()
         self.long_term_memory = {}
-        self.memory_index = {}
+        self.memory_index: Dict[str, Set[str]] = {}
         
-        self.short_term_file = os.path.join(root_dir, "short_term.json")
+        # 短期记忆为追加写的 JSONL 段，淘汰条目时整体重写（轮换）
+        self.short_term_file = os.path.join(root_dir, "short_term.jsonl")
+        self._legacy_short_term_file = os.path.join(root_dir, "short_term.json")
         self.long_term_file = os.path.join(root_dir, "long_term.json")
         self.index_file = os.path.join(root_dir, "index.json")
         
+        self._pending_short_term: List[Dict] = []
+        self._rotate_short_term = False
+        self._long_term_dirty = False
+        self._dirty_count = 0
+        self._flush_timer: Optional[threading.Timer] = None
+        # 记忆ID -> (小写内容, 二元组位图)，仅驻留内存，避免每次检索重复计算
+        self._scan_cache: Dict[str, Tuple[str, int]] = {}
+        # 记忆每次增删都递增版本号，(query, max_tokens) -> (版本号, 上下文)
+        self._version = 0
+        self._context_cache: Dict[Tuple[str, int], Tuple[int, str]] = {}
+        
+        # 记录与压缩可能在后台线程执行，读写记忆需串行化
+        self._lock = threading.RLock()
+        
         self._init_storage()
+        _LIVE_MEMORIES.add(self)
     
     def _init_storage(self):
         if not os.path.exists(self.root_dir):
@@ -38,10 +88,7 @@ class VectorMemory:
     
     def _load_from_disk(self):
         try:
-            if os.path.exists(self.short_term_file):
-                with open(self.short_term_file, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                    self.short_term_memory = OrderedDict(data)
+            self._load_short_term()
         except:
             self.short_term_memory = OrderedDict()
         
@@ -55,19 +102,76 @@ class VectorMemory:
         try:
             if os.path.exists(self.index_file):
                 with open(self.index_file, "r", encoding="utf-8") as f:
-                    self.memory_index = json.load(f)
+                    self.memory_index = {k: set(v) for k, v in json.load(f).items()}
         except:
             self.memory_index = {}
     
+    def _load_short_term(self):
+        if os.path.exists(self.short_term_file):
+            with open(self.short_term_file, "rb") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = loads(line)
+                    except ValueError:
+                        # 写入中断留下的半行
+                        continue
+                    self.short_term_memory[entry["id"]] = entry
+        elif os.path.exists(self._legacy_short_term_file):
+            with open(self._legacy_short_term_file, "r", encoding="utf-8") as f:
+                self.short_term_memory = OrderedDict(json.load(f))
+            self._rewrite_short_term()
+            os.remove(self._legacy_short_term_file)
+    
+    def _rewrite_short_term(self):
+        tmp_file = self.short_term_file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            f.writelines(dumps(entry) + "\n" for entry in self.short_term_memory.values())
+        os.replace(tmp_file, self.short_term_file)
+    
     def _save_to_disk(self):
-        with open(self.short_term_file, "w", encoding="utf-8") as f:
-            json.dump(dict(self.short_term_memory), f, ensure_ascii=False, indent=2)
-        
-        with open(self.long_term_file, "w", encoding="utf-8") as f:
-            json.dump(self.long_term_memory, f, ensure_ascii=False, indent=2)
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        
+        if self._rotate_short_term:
+            self._rewrite_short_term()
+        elif self._pending_short_term:
+            with open(self.short_term_file, "a", encoding="utf-8") as f:
+                f.writelines(dumps(entry) + "\n" for entry in self._pending_short_term)
+        self._pending_short_term = []
+        self._rotate_short_term = False
+        
+        if self._long_term_dirty:
+            with open(self.long_term_file, "w", encoding="utf-8") as f:
+                f.write(dumps(self.long_term_memory))
+            self._long_term_dirty = False
         
         with open(self.index_file, "w", encoding="utf-8") as f:
-            json.dump(self.memory_index, f, ensure_ascii=False, indent=2)
+            f.write(dumps({k: list(v) for k, v in self.memory_index.items()}))
+        
+        self._dirty_count = 0
+    
+    def flush(self):
+        """将尚未落盘的记忆写入磁盘；存储目录已被删除时放弃写入"""
+        with self._lock:
+            if not (self._dirty_count or self._pending_short_term or self._rotate_short_term):
+                return
+            if not os.path.isdir(self.root_dir):
+                return
+            self._save_to_disk()
+    
+    def close(self):
+        self.flush()
+        _LIVE_MEMORIES.discard(self)
+    
+    def _schedule_flush(self):
+        if self._flush_timer is None:
+            self._flush_timer = threading.Timer(self.FLUSH_INTERVAL, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
     
     def add(self, content: str, metadata: Dict = None, importance: float = 0.5) -> str:
         """
@@ -78,6 +182,18 @@ class VectorMemory:
         :param importance: 重要性 (0-1)
         :return: 记忆ID
         """
+        with self._lock:
+            memory_id = self._add_entry(content, metadata, importance)
+            self._dirty_count += 1
+            if self._dirty_count >= self.FLUSH_EVERY:
+                self._save_to_disk()
+            else:
+                self._schedule_flush()
+        
+        return memory_id
+    
+    def _add_entry(self, content: str, metadata: Dict = None, importance: float = 0.5,
+                   timestamp: float = None) -> str:
         memory_id = self._generate_id(content)
         
         memory_entry = {
@@ -85,33 +201,27 @@ class VectorMemory:
             "content": content,
             "metadata": metadata or {},
             "importance": importance,
-            "timestamp": time.time(),
+            "timestamp": timestamp or time.time(),
             "access_count": 0
         }
         
         self.short_term_memory[memory_id] = memory_entry
+        self._version += 1
+        self._scan_entry(memory_id, content)
+        self._pending_short_term.append(memory_entry)
         self._update_index(memory_id, content)
         
         if importance >= 0.7:
             self.long_term_memory[memory_id] = memory_entry
+            self._long_term_dirty = True
         
         if len(self.short_term_memory) > self.max_short_term:
             self._compress_short_term()
         
-        self._save_to_disk()
-        
         return memory_id
     
-    def add_interaction(self, user_input: str, assistant_response: str, 
-                        tool_calls: List = None, importance: float = None):
-        """
-        添加交互记录
-        
-        :param user_input: 用户输入
-        :param assistant_response: 助手响应
-        :param tool_calls: 工具调用记录
-        :param importance: 重要性 (自动计算如果为None)
-        """
+    def _interaction_entry(self, user_input: str, assistant_response: str,
+                           tool_calls: List = None, importance: float = None) -> tuple:
         if importance is None:
             importance = self._calculate_importance(user_input, assistant_response, tool_calls)
         
@@ -125,7 +235,37 @@ class VectorMemory:
             "tool_calls": tool_calls or []
         }
         
-        self.add(content, metadata, importance)
+        return content, metadata, importance
+    
+    def add_interaction(self, user_input: str, assistant_response: str, 
+                        tool_calls: List = None, importance: float = None):
+        """
+        添加交互记录
+        
+        :param user_input: 用户输入
+        :param assistant_response: 助手响应
+        :param tool_calls: 工具调用记录
+        :param importance: 重要性 (自动计算如果为None)
+        """
+        self.add(*self._interaction_entry(user_input, assistant_response, tool_calls, importance))
+    
+    def record_batch(self, items: List[tuple]) -> List[str]:
+        """
+        批量添加交互记录，整批只写一次磁盘
+        
+        :param items: [(user_input, assistant_response, tool_calls, timestamp), ...]
+        :return: 记忆ID列表
+        """
+        memory_ids = []
+        with self._lock:
+            for user_input, assistant_response, tool_calls, timestamp in items:
+                content, metadata, importance = self._interaction_entry(user_input, assistant_response, tool_calls)
+                memory_ids.append(self._add_entry(content, metadata, importance, timestamp))
+            
+            if memory_ids:
+                self._save_to_disk()
+        
+        return memory_ids
     
     def retrieve_relevant(self, query: str, top_k: int = 5) -> List[str]:
         """
@@ -135,28 +275,46 @@ class VectorMemory:
         :param top_k: 返回数量
         :return: 相关记忆列表
         """
-        query_keywords = self._extract_keywords(query)
-        
-        scores = {}
-        
-        for memory_id, memory in self.short_term_memory.items():
-            score = self._calculate_relevance(query_keywords, memory["content"])
-            scores[memory_id] = score
-        
-        for memory_id, memory in self.long_term_memory.items():
-            score = self._calculate_relevance(query_keywords, memory["content"])
-            scores[memory_id] = score * 1.2
-        
-        sorted_ids = sorted(scores.keys(), key=lambda x: scores[x], reverse=True)[:top_k]
-        
-        results = []
-        for mid in sorted_ids:
-            if mid in self.short_term_memory:
-                results.append(self.short_term_memory[mid]["content"])
-            elif mid in self.long_term_memory:
-                results.append(self.long_term_memory[mid]["content"])
-        
-        return results
+        return [content for content, _, _ in self._retrieve_entries(query, top_k)]
+    
+    def _retrieve_entries(self, query: str, top_k: int) -> List[Tuple[str, str, int]]:
+        """返回 [(内容, 预览行, 估算 token 数), ...]"""
+        query_keywords = list(self._extract_keywords(query))
+        
+        query_masks = [_bigram_mask(keyword) for keyword in query_keywords]
+        
+        with self._lock:
+            # 倒排索引取候选，只对候选打分
+            candidates = set()
+            for keyword in query_keywords:
+                candidates.update(self.memory_index.get(keyword, ()))
+            # 旧索引文件中可能残留已淘汰的记忆ID，只统计仍然存在的
+            candidates = {
+                memory_id for memory_id in candidates
+                if memory_id in self.short_term_memory or memory_id in self.long_term_memory
+            }
+            
+            # 索引按空白分词，而相关性是子串匹配；候选不足时退回全量扫描
+            if len(candidates) < top_k:
+                candidates = self.short_term_memory.keys() | self.long_term_memory.keys()
+            
+            scored = []
+            for memory_id in candidates:
+                memory = self.long_term_memory.get(memory_id)
+                boost = 1.2
+                if memory is None:
+                    memory = self.short_term_memory.get(memory_id)
+                    boost = 1.0
+                if memory is None:
+                    continue
+                content_lower, bloom = self._scan_entry(memory_id, memory["content"])
+                score = self._calculate_relevance(query_keywords, query_masks, content_lower, bloom) * boost
+                scored.append((score, memory.get("timestamp", 0), memory["content"]))
+        
+        return [
+            (content, f"- {content[:200]}...", len(content) // 2)
+            for _, _, content in heapq.nlargest(top_k, scored)
+        ]
     
     def get_context_for_prompt(self, query: str, max_tokens: int = 1000) -> str:
         """
@@ -166,22 +324,34 @@ class VectorMemory:
         :param max_tokens: 最大 token 数 (估算)
         :return: 格式化的上下文字符串
         """
-        relevant = self.retrieve_relevant(query, top_k=5)
-        
-        if not relevant:
-            return ""
-        
-        context_parts = ["## 相关记忆"]
-        current_length = 0
+        key = (query, max_tokens)
+        with self._lock:
+            version = self._version
+            cached = self._context_cache.get(key)
+            if cached and cached[0] == version:
+                return cached[1]
+        
+        relevant = self._retrieve_entries(query, top_k=5)
+        
+        context = ""
+        if relevant:
+            context_parts = ["## 相关记忆"]
+            current_length = 0
+            
+            for _, preview, estimated_tokens in relevant:
+                if current_length + estimated_tokens > max_tokens:
+                    break
+                context_parts.append(preview)
+                current_length += estimated_tokens
+            
+            context = "\n".join(context_parts)
         
-        for memory in relevant:
-            estimated_tokens = len(memory) // 2
-            if current_length + estimated_tokens > max_tokens:
-                break
-            context_parts.append(f"- {memory[:200]}...")
-            current_length += estimated_tokens
+        with self._lock:
+            if len(self._context_cache) >= 64:
+                self._context_cache.clear()
+            self._context_cache[key] = (version, context)
         
-        return "\n".join(context_parts)
+        return context
     
     def compress(self, llm_client) -> str:
         """
@@ -193,7 +363,8 @@ class VectorMemory:
         if len(self.short_term_memory) < 5:
             return "记忆较少，无需压缩"
         
-        memories = list(self.short_term_memory.values())
+        with self._lock:
+            memories = list(self.short_term_memory.values())
         memory_text = "\n\n".join([
             f"[{m['metadata'].get('type', 'unknown')}] {m['content']}" 
             for m in memories[-10:]
@@ -215,12 +386,17 @@ class VectorMemory:
         if summary:
             self.add(summary, {"type": "summary"}, importance=0.8)
             
-            for memory_id in list(self.short_term_memory.keys())[:-5]:
-                memory = self.short_term_memory[memory_id]
-                if memory.get("importance", 0) < 0.6:
-                    del self.short_term_memory[memory_id]
-            
-            self._save_to_disk()
+            with self._lock:
+                for memory_id in list(self.short_term_memory.keys())[:-5]:
+                    memory = self.short_term_memory.get(memory_id)
+                    if memory and memory.get("importance", 0) < 0.6:
+                        self.short_term_memory.pop(memory_id, None)
+                        if memory_id not in self.long_term_memory:
+                            self._forget(memory_id, memory["content"])
+                
+                self._rotate_short_term = True
+                self._version += 1
+                self._save_to_disk()
         
         return summary or "压缩失败"
     
@@ -230,25 +406,30 @@ class VectorMemory:
     def _update_index(self, memory_id: str, content: str):
         keywords = self._extract_keywords(content)
         for keyword in keywords:
-            if keyword not in self.memory_index:
-                self.memory_index[keyword] = []
-            if memory_id not in self.memory_index[keyword]:
-                self.memory_index[keyword].append(memory_id)
+            postings = self.memory_index.get(keyword)
+            if postings is None:
+                postings = self.memory_index[keyword] = set()
+            postings.add(memory_id)
     
-    def _extract_keywords(self, text: str) -> List[str]:
-        stop_words = {"的", "是", "在", "了", "和", "与", "或", "有", "这", "那", "我", "你", "他", "她", "它"}
-        
-        words = []
-        for word in text.split():
-            clean_word = word.strip("，。！？、：""''()（）[]【】")
-            if len(clean_word) > 1 and clean_word not in stop_words:
-                words.append(clean_word.lower())
-        
-        return list(set(words))
+    def _extract_keywords(self, text: str) -> Set[str]:
+        return {
+            word.lower() for word in text.translate(_PUNCT_TRANS).split()
+            if len(word) > 1 and word not in _STOP_WORDS
+        }
     
-    def _calculate_relevance(self, query_keywords: List[str], content: str) -> float:
-        content_lower = content.lower()
-        matches = sum(1 for kw in query_keywords if kw in content_lower)
+    def _scan_entry(self, memory_id: str, content: str) -> Tuple[str, int]:
+        cached = self._scan_cache.get(memory_id)
+        if cached is None:
+            content_lower = content.lower()
+            cached = self._scan_cache[memory_id] = (content_lower, _bigram_mask(content_lower))
+        return cached
+    
+    def _calculate_relevance(self, query_keywords: List[str], query_masks: List[int],
+                             content_lower: str, bloom: int) -> float:
+        matches = sum(
+            1 for kw, mask in zip(query_keywords, query_masks)
+            if bloom & mask == mask and kw in content_lower
+        )
         return matches / max(len(query_keywords), 1)
     
     def _calculate_importance(self, user_input: str, response: str, tool_calls: List) -> float:
@@ -268,11 +449,28 @@ class VectorMemory:
         return min(importance, 1.0)
     
     def _compress_short_term(self):
-        items = list(self.short_term_memory.items())
-        
-        items.sort(key=lambda x: x[1].get("importance", 0), reverse=True)
-        
-        self.short_term_memory = OrderedDict(items[:self.max_short_term])
+        excess = len(self.short_term_memory) - self.max_short_term
+        if excess <= 0:
+            return
+        
+        to_remove = heapq.nsmallest(
+            excess, self.short_term_memory.items(), key=lambda x: x[1].get("importance", 0)
+        )
+        for memory_id, memory in to_remove:
+            del self.short_term_memory[memory_id]
+            if memory_id not in self.long_term_memory:
+                self._forget(memory_id, memory["content"])
+        self._rotate_short_term = True
+    
+    def _forget(self, memory_id: str, content: str):
+        """记忆被彻底淘汰后清理其缓存与倒排索引"""
+        self._scan_cache.pop(memory_id, None)
+        for keyword in self._extract_keywords(content):
+            postings = self.memory_index.get(keyword)
+            if postings is not None:
+                postings.discard(memory_id)
+                if not postings:
+                    del self.memory_index[keyword]
     
     def get_stats(self) -> Dict:
         return {
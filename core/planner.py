@@ -1,7 +1,19 @@
-import json
-from typing import List, Dict, Any, Optional
+import copy
+import math
+import hashlib
+import threading
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Dict, Any, Optional, Tuple
 from dataclasses import dataclass, field
 
+from core.json_utils import extract_json, dumps
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
 @dataclass
 class Task:
     """任务节点"""
@@ -12,6 +24,87 @@ class Task:
     result: Optional[Dict] = None
     tool_used: Optional[str] = None
 
+# 精确匹配缓存：规范化输入 + 工具列表 -> 已解析计划，位于语义缓存之前
+_PLAN_LRU: "OrderedDict[bytes, Dict]" = OrderedDict()
+_PLAN_LRU_SIZE = 512
+NO_CACHE_PREFIX = "no_cache:"
+
+
+_COMPLEX_KEYWORDS = ("然后", "接着", "之后", "同时", "并且", "以及", "还要", "再")
+_PARALLEL_WORDS = ("和", "与")
+
+
+def _build_keyword_automaton():
+    """复杂度关键词构建为 Aho-Corasick 自动机，一遍扫描输入即可得到全部命中"""
+    if ahocorasick is None:
+        return None
+    
+    automaton = ahocorasick.Automaton()
+    for word in _COMPLEX_KEYWORDS + _PARALLEL_WORDS:
+        automaton.add_word(word, word)
+    automaton.make_automaton()
+    return automaton
+
+
+_KEYWORD_AC = _build_keyword_automaton()
+
+
+def _plan_cache_key(user_input: str, tool_list: str) -> bytes:
+    h = hashlib.blake2b(user_input.strip().lower().encode("utf-8"), digest_size=16)
+    h.update(b"\x00")
+    h.update(tool_list.encode("utf-8"))
+    return h.digest()
+
+
+class SemanticRouteCache:
+    """
+    "是否需要分解"判定的语义缓存
+
+    以字符二元组向量的余弦相似度近似语义相似度，相似度超过阈值时复用已有判定。
+    只缓存判定标签，不缓存计划本身：相似输入的具体参数（文件名、收件人等）可能不同
+    """
+
+    def __init__(self, threshold: float = 0.9, max_entries: int = 256):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._entries: List[Tuple[Counter, float, bool]] = []
+
+    @staticmethod
+    def _embed(text: str) -> Tuple[Counter, float]:
+        text = text.strip().lower()
+        grams = Counter(text[i:i + 2] for i in range(len(text) - 1)) if len(text) > 1 else Counter([text])
+        norm = math.sqrt(sum(v * v for v in grams.values()))
+        return grams, norm
+
+    def lookup(self, text: str) -> Optional[bool]:
+        vec, norm = self._embed(text)
+        if not norm:
+            return None
+
+        best_label, best_score = None, 0.0
+        for entry_vec, entry_norm, label in self._entries:
+            small, large = (vec, entry_vec) if len(vec) <= len(entry_vec) else (entry_vec, vec)
+            dot = sum(count * large[gram] for gram, count in small.items() if gram in large)
+            score = dot / (norm * entry_norm)
+            if score > best_score:
+                best_label, best_score = label, score
+
+        if best_label is not None and best_score >= self.threshold:
+            return best_label
+        return None
+
+    def insert(self, text: str, label: bool):
+        vec, norm = self._embed(text)
+        if not norm:
+            return
+        if len(self._entries) >= self.max_entries:
+            self._entries.pop(0)
+        self._entries.append((vec, norm, label))
+
+    def clear(self):
+        self._entries.clear()
+
+
 class TaskPlanner:
     """
     智能任务规划器
@@ -26,6 +119,12 @@ class TaskPlanner:
         self.llm = llm_client
         self.skills = skill_manager
         
+        # 工具列表变化后缓存的判定不再可靠，需要清空
+        self._plan_cache = SemanticRouteCache()
+        self._plan_cache_tools: Optional[str] = None
+        # (技能目录版本号, 工具列表文本)
+        self._tool_list_cache: Optional[Tuple[int, str]] = None
+        
         self.decomposition_prompt = """你是一个任务规划专家。请分析用户任务并分解为可执行的子任务。
 
 ## 用户任务
@@ -70,6 +169,25 @@ class TaskPlanner:
         """
         tool_list = self._get_tool_list()
         
+        use_cache = not user_input.startswith(NO_CACHE_PREFIX)
+        if not use_cache:
+            user_input = user_input[len(NO_CACHE_PREFIX):].lstrip()
+        
+        if tool_list != self._plan_cache_tools:
+            self._plan_cache.clear()
+            self._plan_cache_tools = tool_list
+        
+        if use_cache:
+            key = _plan_cache_key(user_input, tool_list)
+            cached = _PLAN_LRU.get(key)
+            if cached is not None:
+                _PLAN_LRU.move_to_end(key)
+                return copy.deepcopy(cached)
+            
+            # 相似输入此前判定为无需分解时，直接生成以当前输入为描述的简单计划
+            if self._plan_cache.lookup(user_input) is False:
+                return self._create_simple_plan(user_input)
+        
         prompt = self.decomposition_prompt.format(
             task_description=user_input,
             tool_list=tool_list
@@ -99,9 +217,18 @@ class TaskPlanner:
         if not plan_data:
             return self._create_simple_plan(user_input)
         
+        if use_cache:
+            _PLAN_LRU[key] = copy.deepcopy(plan_data)
+            if len(_PLAN_LRU) > _PLAN_LRU_SIZE:
+                _PLAN_LRU.popitem(last=False)
+            self._plan_cache.insert(user_input, bool(plan_data.get("need_decomposition", False)))
         return plan_data
 
     def _get_tool_list(self) -> str:
+        version = self.skills.version
+        if self._tool_list_cache is not None and self._tool_list_cache[0] == version:
+            return self._tool_list_cache[1]
+        
         tools = self.skills.get_all_tools_schema()
         lines = []
         for schema in tools:
@@ -111,24 +238,18 @@ class TaskPlanner:
             params = func.get("parameters", {}).get("properties", {})
             param_str = ", ".join(params.keys()) if params else "无参数"
             lines.append(f"- {name}({param_str}): {desc}")
-        return "\n".join(lines)
+        
+        tool_list = "\n".join(lines)
+        self._tool_list_cache = (version, tool_list)
+        return tool_list
 
     def _parse_plan_response(self, response: str) -> Optional[Dict]:
-        try:
-            json_str = response
-            if "```json" in json_str:
-                json_str = json_str.split("```json")[1].split("```")[0]
-            elif "```" in json_str:
-                json_str = json_str.split("```")[1].split("```")[0]
-            
-            plan_data = json.loads(json_str.strip())
-            
-            if "tasks" not in plan_data:
-                return None
-            
-            return plan_data
-        except (json.JSONDecodeError, KeyError, IndexError):
+        plan_data = extract_json(response)
+        
+        if not isinstance(plan_data, dict) or "tasks" not in plan_data:
             return None
+        
+        return plan_data
 
     def _create_simple_plan(self, user_input: str) -> Dict:
         return {
@@ -152,13 +273,17 @@ class TaskPlanner:
         factors = []
         score = 0
         
-        complex_keywords = ["然后", "接着", "之后", "同时", "并且", "以及", "还要", "再"]
-        for kw in complex_keywords:
-            if kw in user_input:
+        if _KEYWORD_AC is not None:
+            found = {word for _, word in _KEYWORD_AC.iter(user_input)}
+        else:
+            found = {word for word in _COMPLEX_KEYWORDS + _PARALLEL_WORDS if word in user_input}
+        
+        for kw in _COMPLEX_KEYWORDS:
+            if kw in found:
                 score += 1
                 factors.append(f"包含连接词 '{kw}'")
         
-        if "和" in user_input or "与" in user_input:
+        if not found.isdisjoint(_PARALLEL_WORDS):
             score += 1
             factors.append("包含并列关系")
         
@@ -190,6 +315,11 @@ class DynamicPlanner:
     动态规划器 - 支持运行时调整计划
     """
     
+    # 依赖已满足的子任务最多同时执行的数量
+    MAX_PARALLEL_TASKS = 8
+    # 一次执行中按 LLM 建议调整计划的最多次数
+    MAX_PLAN_ADJUSTMENTS = 3
+    
     def __init__(self, llm_client, skill_manager):
         self.llm = llm_client
         self.skills = skill_manager
@@ -203,9 +333,10 @@ class DynamicPlanner:
         
         :param user_input: 用户输入
         :param context: 上下文
-        :param executor: 执行函数 (task) -> result
+        :param executor: 执行函数 (task) -> result，互不依赖的子任务会在线程池中并发调用
         :return: 执行结果
         """
+        # 规划提示词已在一次调用中同时给出"是否分解"与任务列表，无需单独的路由调用
         plan = self.planner.plan(user_input, context)
         
         if not plan.get("need_decomposition", False):
@@ -214,21 +345,7 @@ class DynamicPlanner:
             return {"success": False, "message": "无执行器"}
         
         tasks = plan.get("tasks", [])
-        results = []
-        
-        for task in tasks:
-            if executor:
-                result = executor(task)
-                results.append({
-                    "task": task,
-                    "result": result
-                })
-                
-                if not result.get("success", False):
-                    adjustment = self._check_need_adjustment(task, result, tasks)
-                    if adjustment:
-                        new_plan = self._adjust_plan(task, result, tasks)
-                        tasks = new_plan.get("tasks", tasks[len(results):])
+        results = self._execute_task_graph(tasks, executor) if executor else []
         
         return {
             "success": all(r["result"].get("success", True) for r in results),
@@ -236,6 +353,84 @@ class DynamicPlanner:
             "plan": plan
         }
 
+    def _execute_task_graph(self, tasks: List[Dict], executor: callable,
+                            adjustments_left: int = None) -> List[Dict]:
+        """
+        按 depends_on 构成的依赖图执行任务，依赖已满足的任务并发执行
+        
+        同一工具的任务串行执行（浏览器等工具共享状态）；结果按计划顺序返回。
+        有任务失败且需要调整时停止派发新任务，等执行中的任务结束后再调整计划，按调整后的任务继续执行
+        """
+        if adjustments_left is None:
+            adjustments_left = self.MAX_PLAN_ADJUSTMENTS
+        
+        index = {str(task.get("id", i)): i for i, task in enumerate(tasks)}
+        pending = {
+            i: {index[str(dep)] for dep in task.get("depends_on") or [] if index.get(str(dep), i) != i}
+            for i, task in enumerate(tasks)
+        }
+        dependents: Dict[int, List[int]] = {i: [] for i in pending}
+        for i, deps in pending.items():
+            for dep in deps:
+                dependents[dep].append(i)
+        
+        tool_locks = {task.get("tool"): threading.Lock() for task in tasks}
+        
+        def run_task(i: int) -> Dict:
+            with tool_locks[tasks[i].get("tool")]:
+                return executor(tasks[i])
+        
+        results: List[Optional[Dict]] = [None] * len(tasks)
+        failed: Optional[int] = None
+        
+        def on_result(i: int, result: Dict):
+            nonlocal failed
+            results[i] = {"task": tasks[i], "result": result}
+            if failed is None and adjustments_left > 0 and not result.get("success", False):
+                remaining = [tasks[j] for j in range(len(tasks)) if results[j] is None]
+                if self._check_need_adjustment(tasks[i], result, remaining):
+                    failed = i
+        
+        ready = deque(i for i, deps in pending.items() if not deps)
+        with ThreadPoolExecutor(max_workers=self.MAX_PARALLEL_TASKS, thread_name_prefix="neo-task") as pool:
+            running = {}
+            while running or (ready and failed is None):
+                while ready and failed is None:
+                    i = ready.popleft()
+                    running[pool.submit(run_task, i)] = i
+                
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    i = running.pop(future)
+                    on_result(i, future.result())
+                    for j in dependents[i]:
+                        pending[j].discard(i)
+                        if not pending[j]:
+                            ready.append(j)
+        
+        # 循环依赖的任务无法就绪，按计划顺序串行执行
+        for i in range(len(tasks)):
+            if failed is not None:
+                break
+            if results[i] is None:
+                on_result(i, executor(tasks[i]))
+        
+        if failed is None:
+            return results
+        
+        remaining = [tasks[j] for j in range(len(tasks)) if results[j] is None]
+        adjustment = self._adjust_plan(tasks[failed], results[failed]["result"], remaining)
+        new_tasks = adjustment.get("new_tasks")
+        if not isinstance(new_tasks, list):
+            new_tasks = remaining
+        new_tasks = [
+            task if isinstance(task, dict) else {"description": str(task)}
+            for task in new_tasks
+        ]
+        
+        done = [r for r in results if r is not None]
+        return done + self._execute_task_graph(new_tasks, executor, adjustments_left - 1)
+
     def _check_need_adjustment(self, failed_task: Dict, result: Dict, remaining_tasks: List) -> bool:
         return not result.get("success", False)
 
@@ -244,7 +439,7 @@ class DynamicPlanner:
 
 失败的任务: {failed_task.get('description')}
 失败原因: {result.get('error', '未知')}
-剩余任务: {json.dumps([t.get('description') for t in remaining_tasks], ensure_ascii=False)}
+剩余任务: {dumps([t.get('description') for t in remaining_tasks])}
 
 请提供调整建议，JSON格式:
 {{
@@ -255,9 +450,7 @@ class DynamicPlanner:
         
         response = self.llm.simple_chat(prompt)
         
-        try:
-            if "```json" in response:
-                response = response.split("```json")[1].split("```")[0]
-            return json.loads(response.strip())
-        except:
+        adjustment = extract_json(response)
+        if not isinstance(adjustment, dict):
             return {"action": "continue", "new_tasks": remaining_tasks}
+        return adjustment
@@ -1,7 +1,40 @@
-import json
 import time
+from concurrent.futures import ThreadPoolExecutor, Future
 from typing import List, Dict, Any, Optional, Callable
 
+from core.json_utils import loads, dumps
+from core.skill_manager import strip_code_fence
+
+
+def _compact_result(result: Any, max_chars: int) -> str:
+    """
+    压缩注入到对话中的工具结果
+    
+    优先截断最长的字符串字段，保留 success/error/确认信息等小字段；仍超长时整体截断
+    """
+    text = dumps(result)
+    if len(text) <= max_chars:
+        return text
+    
+    if isinstance(result, dict):
+        compact = dict(result)
+        long_keys = sorted(
+            (k for k, v in compact.items() if isinstance(v, str) and len(v) > 200),
+            key=lambda k: len(compact[k]),
+            reverse=True
+        )
+        for key in long_keys:
+            value = compact[key]
+            # 预留截断标记的长度
+            keep = max(len(value) - (len(text) - max_chars) - 32, 200)
+            compact[key] = f"{value[:keep]}...<已截断 {len(value) - keep} 字符>"
+            text = dumps(compact)
+            if len(text) <= max_chars:
+                return text
+    
+    return f"{text[:max_chars]}...<已截断 {len(text) - max_chars} 字符>"
+
+
 class ReActAgent:
     """
     ReAct Agent: 推理(Reasoning) + 行动(Acting) 循环
@@ -18,6 +51,9 @@ class ReActAgent:
     - 错误恢复：失败时尝试其他方法
     """
     
+    # 单个工具结果注入对话的最大字符数，完整结果保留在 execution_trace 中
+    MAX_TOOL_RESULT_CHARS = 4000
+    
     def __init__(self, llm_client, skill_manager, memory_system=None, max_iterations=15):
         self.llm = llm_client
         self.skills = skill_manager
@@ -26,6 +62,10 @@ class ReActAgent:
         
         self.execution_trace = []
         self.generated_skills = []
+        self._tool_executor: Optional[ThreadPoolExecutor] = None
+        # 工具 Schema 与系统提示词只在技能列表变化时重建
+        self._prompt_cache_key: Optional[int] = None
+        self._prompt_cache: Optional[tuple] = None
         
         self.system_prompt = """你是一个智能助手 Neo，使用 ReAct 模式工作。
 
@@ -117,15 +157,15 @@ class ReActAgent:
 当你认为任务完成时，直接回复用户。
 当需要用户确认时，直接向用户询问，等待用户回复后再继续。"""
 
-    def run(self, user_input: str, context: List[Dict] = None, on_progress: Callable = None, on_log: Callable = None) -> Dict:
+    def run(self, user_input: str, context: List[Dict] = None, on_progress: Callable = None, on_log: Callable = None,
+            on_token: Callable = None) -> Dict:
         self.execution_trace = []
         self.generated_skills = []
         self.llm_logs = []
         
-        tool_schemas = self._get_tool_schemas_with_create_skill()
-        tool_descriptions = self._format_tool_descriptions(tool_schemas)
+        tool_schemas, system_content = self._get_prompt_state()
         
-        messages = self._build_initial_messages(user_input, context, tool_descriptions)
+        messages = self._build_initial_messages(user_input, context, system_content)
         
         for iteration in range(self.max_iterations):
             if on_progress:
@@ -153,10 +193,25 @@ class ReActAgent:
                     "tools_available": [t["function"]["name"] for t in tool_schemas]
                 })
             
-            response = self.llm.chat(messages, tools=tool_schemas)
-            
+            early: Dict[str, tuple] = {}
+            if on_token:
+                seen_names = set()
+                response = self.llm.chat_stream(
+                    messages, tools=tool_schemas, on_delta=on_token,
+                    on_tool_call=lambda tool_call: self._dispatch_early(tool_call, early, seen_names)
+                )
+            else:
+                response = self.llm.chat(messages, tools=tool_schemas)
             
             if not response:
+                # 流式中途失败时，已提前启动的工具可能产生了副作用，等待完成并记入执行轨迹
+                for tool_name, tool_args, future in early.values():
+                    self.execution_trace.append({
+                        "iteration": iteration + 1,
+                        "tool": tool_name,
+                        "args": tool_args,
+                        "result": future.result()
+                    })
                 return self._build_result(False, "LLM 请求失败", messages)
             
             message = response["choices"][0]["message"]
@@ -176,14 +231,11 @@ class ReActAgent:
                 final_content = message.get("content", "")
                 return self._build_result(True, final_content, messages)
             
+            calls = []
             for tool_call in tool_calls:
                 tool_name = tool_call["function"]["name"]
-                args_str = tool_call["function"]["arguments"]
-                if isinstance(args_str, str):
-                    tool_args = json.loads(args_str)
-                else:
-                    tool_args = args_str if isinstance(args_str, dict) else {}
-                tool_id = tool_call["id"]
+                tool_args = self._parse_tool_args(tool_call["function"]["arguments"])
+                calls.append((tool_name, tool_args, tool_call["id"]))
                 
                 if on_progress:
                     on_progress("action", f"执行工具: {tool_name}")
@@ -194,12 +246,10 @@ class ReActAgent:
                         "tool": tool_name,
                         "args": tool_args
                     })
-                
-                if tool_name == "create_skill":
-                    result = self._create_skill(tool_args, on_progress)
-                else:
-                    result = self._execute_tool(tool_name, tool_args)
-                
+            
+            results = self._run_tool_calls(calls, on_progress, early)
+            
+            for (tool_name, tool_args, tool_id), result in zip(calls, results):
                 self.execution_trace.append({
                     "iteration": iteration + 1,
                     "tool": tool_name,
@@ -219,18 +269,89 @@ class ReActAgent:
                     "role": "tool",
                     "tool_call_id": tool_id,
                     "name": tool_name,
-                    "content": json.dumps(result, ensure_ascii=False)
+                    "content": _compact_result(result, self.MAX_TOOL_RESULT_CHARS)
                 }
                 messages.append(tool_message)
                 
                 if tool_name == "create_skill" and result.get("success"):
-                    tool_schemas = self._get_tool_schemas_with_create_skill()
+                    tool_schemas, _ = self._get_prompt_state()
                 
                 if on_progress:
                     on_progress("observation", f"观察结果: {self._summarize_result(result)}")
         
         return self._build_result(False, "达到最大迭代次数，任务未完成", messages)
 
+    def _run_tool_calls(self, calls: List[tuple], on_progress: Callable = None,
+                        early: Dict[str, tuple] = None) -> List[Dict]:
+        """
+        执行同一轮返回的多个工具调用
+        
+        互不相同的普通工具并发执行；同名工具（共享浏览器等状态）和 create_skill 保持顺序执行。
+        流式阶段已提前启动的调用直接取其结果
+        """
+        early = early or {}
+        names = [name for name, _, _ in calls]
+        if (len(calls) < 2 and not early) or "create_skill" in names or len(set(names)) != len(names):
+            return [
+                early[tool_id][2].result() if tool_id in early
+                else self._create_skill(args, on_progress) if name == "create_skill"
+                else self._execute_tool(name, args)
+                for name, args, tool_id in calls
+            ]
+        
+        executor = self._get_tool_executor()
+        futures = [
+            early[tool_id][2] if tool_id in early else executor.submit(self._execute_tool, name, args)
+            for name, args, tool_id in calls
+        ]
+        return [future.result() for future in futures]
+
+    @staticmethod
+    def _parse_tool_args(arguments: Any) -> Dict:
+        """解析工具调用参数：空字符串视为无参数，非字符串非字典视为空参数"""
+        if isinstance(arguments, str):
+            return loads(arguments or "{}")
+        return arguments if isinstance(arguments, dict) else {}
+
+    def _dispatch_early(self, tool_call: Dict, early: Dict[str, tuple], seen_names: set):
+        """
+        流式响应中某个工具调用的参数接收完毕时立即在后台执行，与模型继续输出后续调用重叠
+        
+        create_skill 出现后本轮不再提前执行；同名工具、未知工具和参数无法解析的调用留到响应结束后执行
+        """
+        name = tool_call["function"]["name"]
+        blocked = "create_skill" in seen_names or name in seen_names
+        seen_names.add(name)
+        
+        tool_id = tool_call.get("id")
+        if blocked or name == "create_skill" or not tool_id or tool_id in early or name not in self.skills.skills:
+            return
+        
+        try:
+            tool_args = self._parse_tool_args(tool_call["function"]["arguments"])
+        except ValueError:
+            return
+        
+        future = self._get_tool_executor().submit(self._execute_tool, name, tool_args)
+        early[tool_id] = (name, tool_args, future)
+
+    def _get_tool_executor(self) -> ThreadPoolExecutor:
+        if self._tool_executor is None:
+            self._tool_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="neo-tool")
+        return self._tool_executor
+
+    def _get_prompt_state(self) -> tuple:
+        # 同名技能重新注册时名称不变但描述可能变化，以版本号为准
+        key = self.skills.version
+        if self._prompt_cache is None or key != self._prompt_cache_key:
+            tool_schemas = self._get_tool_schemas_with_create_skill()
+            system_content = self.system_prompt.format(
+                tool_descriptions=self._format_tool_descriptions(tool_schemas)
+            )
+            self._prompt_cache = (tool_schemas, system_content)
+            self._prompt_cache_key = key
+        return self._prompt_cache
+
     def _get_tool_schemas_with_create_skill(self) -> List[Dict]:
         schemas = self.skills.get_all_tools_schema()
         
@@ -310,10 +431,7 @@ class ReActAgent:
             return {"success": False, "error": "技能保存失败"}
 
     def _clean_code(self, code: str) -> str:
-        import re
-        code = re.sub(r'```python\s*', '', code, flags=re.IGNORECASE)
-        code = re.sub(r'```\s*', '', code)
-        return code.strip()
+        return strip_code_fence(code)
 
     def _validate_skill_code(self, code: str) -> bool:
         required = ['def run(', 'def get_tool_definition(']
@@ -326,23 +444,21 @@ class ReActAgent:
         except SyntaxError:
             return False
 
-    def _build_initial_messages(self, user_input: str, context: List[Dict], tool_descriptions: str) -> List[Dict]:
-        messages = []
+    def _build_initial_messages(self, user_input: str, context: List[Dict], system_content: str) -> List[Dict]:
+        # 系统提示词与历史对话在轮次间保持字节一致，便于服务端复用前缀缓存；
+        # 每轮变化的相关记忆放在用户输入之前单独注入
+        messages = [{"role": "system", "content": system_content}]
         
-        system_content = self.system_prompt.format(tool_descriptions=tool_descriptions)
+        if context:
+            for msg in list(context)[-10:]:
+                if msg.get("role") in ["user", "assistant"]:
+                    messages.append({"role": msg["role"], "content": msg["content"]})
         
         if self.memory:
             relevant_memories = self.memory.retrieve_relevant(user_input, top_k=3)
             if relevant_memories:
-                memory_context = "\n\n## 相关记忆\n" + "\n".join(relevant_memories)
-                system_content += memory_context
-        
-        messages.append({"role": "system", "content": system_content})
-        
-        if context:
-            for msg in context[-10:]:
-                if msg.get("role") in ["user", "assistant"]:
-                    messages.append({"role": msg["role"], "content": msg["content"]})
+                memory_context = "## 相关记忆\n" + "\n".join(relevant_memories)
+                messages.append({"role": "system", "content": memory_context})
         
         messages.append({"role": "user", "content": user_input})
         
@@ -1,10 +1,12 @@
-import json
 import os
 import re
 import time
 import uuid
 from typing import Dict, List, Optional, Any
 
+from core.json_utils import extract_json
+from core.skill_manager import strip_code_fence
+
 class SkillGenerator:
     """
     动态技能生成器
@@ -171,9 +173,7 @@ def run(arguments: dict) -> dict:
         return "\n".join(lines)
 
     def _clean_code(self, code: str) -> str:
-        code = re.sub(r'```python\s*', '', code, flags=re.IGNORECASE)
-        code = re.sub(r'```\s*', '', code)
-        return code.strip()
+        return strip_code_fence(code)
 
     def _validate_code(self, code: str) -> bool:
         required = ['def run(', 'def get_tool_definition(', 'return']
@@ -220,8 +220,8 @@ class AutonomousAgent:
 {existing_skills}
 
 ## 判断标准
-1. 如果现有技能可以完成任务，返回 {"need_new_skill": false, "reason": "..."}
-2. 如果需要新技能，返回 {"need_new_skill": true, "skill_description": "详细描述需要什么技能", "skill_args": {"参数名": "值"}}
+1. 如果现有技能可以完成任务，返回 {{"need_new_skill": false, "reason": "..."}}
+2. 如果需要新技能，返回 {{"need_new_skill": true, "skill_description": "详细描述需要什么技能", "skill_args": {{"参数名": "值"}}}}
 
 只返回 JSON，不要有其他内容。"""
 
@@ -284,15 +284,10 @@ class AutonomousAgent:
         if not response:
             return {"need_new_skill": False, "reason": "分析失败"}
         
-        try:
-            if "```json" in response:
-                response = response.split("```json")[1].split("```")[0]
-            elif "```" in response:
-                response = response.split("```")[1].split("```")[0]
-            
-            return json.loads(response.strip())
-        except:
+        analysis = extract_json(response)
+        if not isinstance(analysis, dict):
             return {"need_new_skill": False, "reason": "解析失败"}
+        return analysis
 
     def _execute_with_existing_skills(self, user_input: str) -> Dict:
         from core.react_agent import ReActAgent
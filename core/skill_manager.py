@@ -13,11 +13,27 @@ import importlib.util
 import sys
 import json
 import re
-from typing import List, Dict, Any, Optional, Callable
+import heapq
+from typing import List, Dict, Any, Optional, Callable, Set
 
 from .skill_loader import SkillLoader
 
 
+_FENCE_OPEN_RE = re.compile(r'^```(?:[ \t]*[\w+.-]*[ \t]*\n|(?:python)?\s*)', re.IGNORECASE)
+
+
+def strip_code_fence(code: str) -> str:
+    """
+    去除 LLM 输出外层的 Markdown 代码块标记（```python / ```）
+
+    只处理开头的围栏（可带语言标记）和结尾的围栏，代码内部的 ``` 保持不动
+    """
+    code = _FENCE_OPEN_RE.sub('', code.strip(), count=1)
+    if code.endswith("```"):
+        code = code[:-3]
+    return code.strip()
+
+
 class SkillManager:
     """
     增强型技能管理器
@@ -39,6 +55,12 @@ class SkillManager:
         
         self.skills: Dict[str, Dict] = {}
         self.skill_embeddings: Dict[str, List[str]] = {}
+        # 关键词二元组 -> 技能名，检索时只对可能匹配的技能打分
+        self._gram_index: Dict[str, Set[str]] = {}
+        # 工具 Schema 列表缓存，注册新技能时失效
+        self._schema_cache: Optional[List[Dict]] = None
+        # 技能注册或重载时递增，供下游缓存判断技能目录是否变化
+        self.version = 0
         
         self.md_loader = SkillLoader(md_skills_dir)
         
@@ -190,6 +212,8 @@ class SkillManager:
         
         real_name = schema["function"]["name"]
         
+        self._schema_cache = None
+        self.version += 1
         self.skills[real_name] = {
             "func": func,
             "schema": schema,
@@ -202,26 +226,47 @@ class SkillManager:
     
     def _build_skill_index(self):
         self.skill_embeddings = {}
+        self._gram_index = {}
         
         for skill_name, skill_info in self.skills.items():
-            schema = skill_info.get("schema", {})
-            func = schema.get("function", {})
-            
-            keywords = []
-            
-            description = func.get("description", "")
-            keywords.extend(self._extract_keywords(description))
-            
-            name_parts = re.findall(r'[A-Z]?[a-z]+|[A-Z]+(?=[A-Z]|$)', skill_name)
-            keywords.extend([p.lower() for p in name_parts])
-            
-            params = func.get("parameters", {}).get("properties", {})
-            for param_name, param_info in params.items():
-                keywords.append(param_name.lower())
-                if "description" in param_info:
-                    keywords.extend(self._extract_keywords(param_info["description"]))
-            
-            self.skill_embeddings[skill_name] = list(set(keywords))
+            self._index_skill(skill_name, skill_info)
+    
+    def _index_skill(self, skill_name: str, skill_info: Dict):
+        schema = skill_info.get("schema", {})
+        func = schema.get("function", {})
+        
+        keywords = []
+        
+        description = func.get("description", "")
+        keywords.extend(self._extract_keywords(description))
+        
+        name_parts = re.findall(r'[A-Z]?[a-z]+|[A-Z]+(?=[A-Z]|$)', skill_name)
+        keywords.extend([p.lower() for p in name_parts])
+        
+        params = func.get("parameters", {}).get("properties", {})
+        for param_name, param_info in params.items():
+            keywords.append(param_name.lower())
+            if "description" in param_info:
+                keywords.extend(self._extract_keywords(param_info["description"]))
+        
+        self.skill_embeddings[skill_name] = list(set(keywords))
+        
+        for keyword in self.skill_embeddings[skill_name]:
+            for gram in self._keyword_grams(keyword):
+                self._gram_index.setdefault(gram, set()).add(skill_name)
+    
+    def add_skill_incremental(self, name: str):
+        """新技能注册后只为其建立索引，无需重建全部技能索引"""
+        for skill_name, skill_info in self.skills.items():
+            if name in (skill_name, skill_info["source"], skill_info.get("source_path")):
+                self._index_skill(skill_name, skill_info)
+    
+    @staticmethod
+    def _keyword_grams(keyword: str) -> Set[str]:
+        # 互为子串的两个关键词必然共享至少一个二元组；单字符关键词（如参数名 x）以自身为键
+        if len(keyword) < 2:
+            return {keyword}
+        return {keyword[i:i + 2] for i in range(len(keyword) - 1)}
     
     def _extract_keywords(self, text: str) -> List[str]:
         stop_words = {"的", "是", "在", "了", "和", "与", "或", "有", "这", "那", "一个", "可以", "用于", "支持"}
@@ -236,7 +281,9 @@ class SkillManager:
         return keywords
     
     def get_all_tools_schema(self) -> List[Dict]:
-        return [info["schema"] for info in self.skills.values()]
+        if self._schema_cache is None:
+            self._schema_cache = [info["schema"] for info in self.skills.values()]
+        return list(self._schema_cache)
     
     def get_skill(self, name: str) -> Optional[Callable]:
         return self.skills.get(name, {}).get("func")
@@ -268,12 +315,17 @@ class SkillManager:
     def search_skills(self, query: str, top_k: int = 5) -> List[Dict]:
         query_keywords = self._extract_keywords(query)
         
+        candidates = set()
+        for keyword in query_keywords:
+            for gram in self._keyword_grams(keyword) | set(keyword):
+                candidates.update(self._gram_index.get(gram, ()))
+        
         scores = {}
         for skill_name, skill_keywords in self.skill_embeddings.items():
-            score = self._calculate_similarity(query_keywords, skill_keywords)
-            scores[skill_name] = score
+            if skill_name in candidates:
+                scores[skill_name] = self._calculate_similarity(query_keywords, skill_keywords)
         
-        sorted_skills = sorted(scores.keys(), key=lambda x: scores[x], reverse=True)[:top_k]
+        sorted_skills = heapq.nlargest(top_k, scores, key=scores.__getitem__)
         
         results = []
         for skill_name in sorted_skills:
@@ -340,7 +392,7 @@ class SkillManager:
         print(f"[SkillManager] ✅ 新技能已保存: {filepath}")
         
         self._load_skill_from_file(filepath, skill_name)
-        self._build_skill_index()
+        self.add_skill_incremental(skill_name)
         
         return filepath
     
@@ -378,14 +430,12 @@ description: |
                         f.write(content)
         
         self._load_md_skill(skill_name)
-        self._build_skill_index()
+        self.add_skill_incremental(skill_name)
         
         return skill_dir
     
     def _clean_code_content(self, code: str) -> str:
-        code = re.sub(r'```python\s*', '', code, flags=re.IGNORECASE)
-        code = re.sub(r'```\s*', '', code)
-        return code.strip()
+        return strip_code_fence(code)
     
     def _validate_skill_code(self, code: str) -> bool:
         required_elements = ['def run(', 'def get_tool_definition(']
@@ -424,6 +474,9 @@ description: |
     
     def reload_skills(self):
         self.skills.clear()
+        self._schema_cache = None
+        self.version += 1
         self.skill_embeddings.clear()
+        self._gram_index.clear()
         self.md_loader.clear_cache()
         self._load_all_skills()
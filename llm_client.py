@@ -1,20 +1,54 @@
 import requests
 import json
 import os
+import atexit
 from dotenv import load_dotenv
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 load_dotenv()
 
+def _encode_payload(payload):
+    if orjson is not None:
+        try:
+            return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass
+    return json.dumps(payload, ensure_ascii=False).encode('utf-8')
+
+
+def _decode(data):
+    # orjson.JSONDecodeError 是 json.JSONDecodeError 的子类，调用方的异常处理保持不变
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
 class LLMClient:
-    def __init__(self, api_key=None, base_url=None, model=None):
+    def __init__(self, api_key=None, base_url=None, model=None, cache_prompt=None):
         self.api_key = api_key or os.getenv("LLM_API_KEY")
         self.base_url = base_url or os.getenv("LLM_BASE_URL", "https://api.qnaigc.com/v1/chat/completions")
         self.model = model or os.getenv("LLM_MODEL", "deepseek/deepseek-v3.2-251201")
+        # 本地 llama.cpp 等服务支持 cache_prompt 复用提示词前缀的 KV 缓存
+        if cache_prompt is None:
+            cache_prompt = os.getenv("LLM_CACHE_PROMPT", "").lower() in ("1", "true", "yes")
+        self.cache_prompt = cache_prompt
         
         self.headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json; charset=utf-8"
         }
+        
+        # 复用同一个 Session 保持长连接，避免每次请求重新握手
+        self._session = requests.Session()
+        self._session.headers.update(self.headers)
+        atexit.register(self.close)
+
+    def close(self):
+        self._session.close()
 
     def chat(self, messages, tools=None, tool_choice="auto", stream=False):
         """
@@ -35,17 +69,101 @@ class LLMClient:
         if tools:
             payload["tools"] = tools
             payload["tool_choice"] = tool_choice
+        if self.cache_prompt:
+            payload["cache_prompt"] = True
 
         try:
-            response = requests.post(
+            response = self._session.post(
                 self.base_url, 
-                data=json.dumps(payload, ensure_ascii=False).encode('utf-8'), 
-                headers=self.headers, 
+                data=_encode_payload(payload), 
                 timeout=120
             )
             response.encoding = 'utf-8'
             response.raise_for_status()
-            return response.json()
+            return _decode(response.content)
+        except requests.exceptions.RequestException as e:
+            print(f"[LLM Client Error] 请求失败: {e}")
+            return None
+        except json.JSONDecodeError:
+            print(f"[LLM Client Error] 响应解析失败")
+            return None
+
+    def chat_stream(self, messages, tools=None, tool_choice="auto", on_delta=None, on_tool_call=None):
+        """
+        流式对话请求：逐块解析 SSE，文本增量通过 on_delta 回调实时输出
+        
+        :param messages: 对话历史列表
+        :param tools: 工具定义列表 (OpenAI 格式)
+        :param tool_choice: 工具选择策略
+        :param on_delta: 文本增量回调 (delta: str) -> None
+        :param on_tool_call: 单个工具调用参数接收完毕时的回调 (tool_call: dict) -> None，
+                             下一个 index 的分片开始到达即视为前一个调用已完整
+        :return: 与 chat() 相同结构的完整响应
+        """
+        payload = {
+            "stream": True,
+            "model": self.model,
+            "messages": messages
+        }
+
+        if tools:
+            payload["tools"] = tools
+            payload["tool_choice"] = tool_choice
+        if self.cache_prompt:
+            payload["cache_prompt"] = True
+
+        content_parts = []
+        tool_calls = {}
+        completed = set()
+
+        try:
+            with self._session.post(
+                self.base_url,
+                data=_encode_payload(payload),
+                timeout=120,
+                stream=True
+            ) as response:
+                response.encoding = 'utf-8'
+                response.raise_for_status()
+                
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    
+                    choices = _decode(data).get("choices") or []
+                    if not choices:
+                        continue
+                    delta = choices[0].get("delta") or {}
+                    
+                    text = delta.get("content")
+                    if text:
+                        content_parts.append(text)
+                        if on_delta:
+                            on_delta(text)
+                    
+                    # 工具调用按 index 分片到达，需要拼接参数
+                    for tc in delta.get("tool_calls") or []:
+                        index = tc.get("index", 0)
+                        if on_tool_call:
+                            for done in sorted(i for i in tool_calls if i < index and i not in completed):
+                                completed.add(done)
+                                on_tool_call(tool_calls[done])
+                        
+                        slot = tool_calls.setdefault(index, {
+                            "id": "",
+                            "type": "function",
+                            "function": {"name": "", "arguments": ""}
+                        })
+                        if tc.get("id"):
+                            slot["id"] = tc["id"]
+                        func = tc.get("function") or {}
+                        if func.get("name"):
+                            slot["function"]["name"] += func["name"]
+                        if func.get("arguments"):
+                            slot["function"]["arguments"] += func["arguments"]
         except requests.exceptions.RequestException as e:
             print(f"[LLM Client Error] 请求失败: {e}")
             return None
@@ -53,6 +171,16 @@ class LLMClient:
             print(f"[LLM Client Error] 响应解析失败")
             return None
 
+        if on_tool_call:
+            for i in sorted(tool_calls):
+                if i not in completed:
+                    on_tool_call(tool_calls[i])
+
+        message = {"role": "assistant", "content": "".join(content_parts) or None}
+        if tool_calls:
+            message["tool_calls"] = [tool_calls[i] for i in sorted(tool_calls)]
+        return {"choices": [{"message": message}]}
+
     def chat_with_tools(self, messages, tools, max_tool_calls=10):
         """
         高级封装：自动处理工具调用循环
@@ -62,6 +62,7 @@ def test_memory():
     import shutil
     
     test_dir = tempfile.mkdtemp()
+    memory = None
     try:
         memory = VectorMemory(root_dir=test_dir)
         
@@ -81,6 +82,8 @@ def test_memory():
         
         return True
     finally:
+        if memory is not None:
+            memory.close()
         shutil.rmtree(test_dir)
 
 def test_planner():
@@ -141,6 +144,240 @@ def test_integration():
     
     return True
 
+def test_unreadable_credentials():
+    print("\n" + "="*50)
+    print("测试 7: 无法读取的凭证文件")
+    print("="*50)
+    
+    import tempfile
+    from pathlib import Path
+    from browser_agent.session_manager import SessionManager
+    
+    tmp_dir = Path(tempfile.mkdtemp())
+    cred_file = tmp_dir / "credentials.enc"
+    original = b"\x01" + b"\x00" * 40
+    cred_file.write_bytes(original)
+    
+    sm = SessionManager(session_dir=str(tmp_dir / "sessions"), credentials_file=str(cred_file))
+    assert sm.credentials == {}
+    
+    sm.save_credentials("https://example.com/login", "alice", "secret")
+    backups = list(tmp_dir.glob("credentials.enc.unreadable-*"))
+    assert len(backups) == 1 and backups[0].read_bytes() == original
+    print(f"✓ 原凭证文件已另存: {backups[0].name}")
+    
+    reloaded = SessionManager(session_dir=str(tmp_dir / "sessions"), credentials_file=str(cred_file))
+    assert reloaded.get_credentials("https://example.com")["username"] == "alice"
+    print("✓ 新凭证正常保存并可读取")
+    
+    return True
+
+def test_strip_code_fence():
+    print("\n" + "="*50)
+    print("测试 8: 代码块标记清理")
+    print("="*50)
+    
+    from core.skill_manager import strip_code_fence
+    
+    cases = [
+        ("```python\ndef run(a):\n    return 1\n```", "def run(a):\n    return 1"),
+        ("```\ndef run(a):\n    return 1\n```", "def run(a):\n    return 1"),
+        ("def run(a):\n    return 1\n```", "def run(a):\n    return 1"),
+        ("```python def run(): pass```", "def run(): pass"),
+        ("```python\ndef run():\n    return '```'\n```", "def run():\n    return '```'"),
+        ("def run(a):\n    return 1", "def run(a):\n    return 1"),
+    ]
+    for raw, expected in cases:
+        assert strip_code_fence(raw) == expected, (raw, strip_code_fence(raw))
+    print(f"✓ {len(cases)} 个用例通过")
+    
+    return True
+
+def test_code_guard_self_protection():
+    print("\n" + "="*50)
+    print("测试 9: CodeGuard 自我保护规则")
+    print("="*50)
+    
+    import tempfile
+    from code_guard import CodeGuard
+    
+    guard = CodeGuard(base_dir=tempfile.mkdtemp())
+    
+    rejected = [
+        "FORBIDDEN_OPERATIONS = {}",
+        "x = 1; PROTECTED_FILES = {}",
+        "if True: SafetyGuard.FORBIDDEN_OPERATIONS = {}",
+        "def f(): PROTECTED_FILES = {}",
+        "class A: PROTECTED_DIRECTORIES = {}",
+        "guard.DANGEROUS_PATTERNS = []",
+        "SafetyGuard.FORBIDDEN_OPERATIONS = frozenset()",
+        "if True: SafetyGuard.FORBIDDEN_OPERATIONS = frozenset({})",
+        "SafetyGuard.SAFE_OPERATIONS = {*x}",
+        "SafetyGuard.SAFE_OPERATIONS = frozenset({*x})",
+    ]
+    for code in rejected:
+        assert guard.check_dangerous_code(code)[0], code
+    print(f"✓ {len(rejected)} 种篡改写法均被拦截")
+    
+    allowed = "print('PROTECTED_FILES = {}')"
+    assert not guard.check_dangerous_code(allowed)[0]
+    print("✓ 字符串中的同名文本不误报")
+    
+    return True
+
+def test_task_graph():
+    print("\n" + "="*50)
+    print("测试 10: 任务依赖图执行")
+    print("="*50)
+    
+    import threading
+    from core.planner import DynamicPlanner
+    
+    class StubLLM:
+        def __init__(self, reply):
+            self.reply = reply
+            self.calls = 0
+        
+        def simple_chat(self, prompt):
+            self.calls += 1
+            return self.reply
+    
+    lock = threading.Lock()
+    events = []
+    running_per_tool = {}
+    barrier = threading.Barrier(2, timeout=5)
+    
+    def executor(task):
+        tool = task.get("tool")
+        with lock:
+            running_per_tool[tool] = running_per_tool.get(tool, 0) + 1
+            assert running_per_tool[tool] == 1, f"工具 {tool} 被并发调用"
+            events.append(("start", task["id"]))
+        if task["id"] in ("a", "b"):
+            barrier.wait()
+        with lock:
+            running_per_tool[tool] -= 1
+            events.append(("end", task["id"]))
+        return {"success": True}
+    
+    tasks = [
+        {"id": "a", "tool": "x"},
+        {"id": "b", "tool": "y"},
+        {"id": "c", "tool": "z", "depends_on": ["a", "b"]},
+        {"id": "d", "tool": "x"},
+        {"id": "e", "tool": "w", "depends_on": ["f"]},
+        {"id": "f", "tool": "w", "depends_on": ["e"]},
+    ]
+    results = DynamicPlanner(StubLLM(""), None)._execute_task_graph(tasks, executor)
+    assert [r["task"]["id"] for r in results] == ["a", "b", "c", "d", "e", "f"]
+    assert events.index(("start", "c")) > max(events.index(("end", "a")), events.index(("end", "b")))
+    print("✓ 无依赖任务并发执行，依赖任务在前置任务完成后执行，同一工具串行")
+    print("✓ 结果按计划顺序返回，循环依赖任务最后串行执行")
+    
+    executed = []
+    
+    def failing_executor(task):
+        executed.append(task["id"])
+        return {"success": task["id"] != "1", "error": "失败"}
+    
+    llm = StubLLM('{"action": "replan", "new_tasks": [{"id": "r", "description": "恢复"}]}')
+    tasks = [
+        {"id": "1", "tool": "x"},
+        {"id": "2", "tool": "x", "depends_on": ["1"]},
+        {"id": "3", "tool": "x", "depends_on": ["2"]},
+    ]
+    results = DynamicPlanner(llm, None)._execute_task_graph(tasks, failing_executor)
+    assert executed == ["1", "r"] and llm.calls == 1
+    assert [r["task"]["id"] for r in results] == ["1", "r"]
+    print("✓ 任务失败后停止派发，并按调整后的 new_tasks 继续执行")
+    
+    llm = StubLLM('{"action": "retry", "new_tasks": [{"id": "again", "tool": "x"}]}')
+    planner = DynamicPlanner(llm, None)
+    results = planner._execute_task_graph([{"id": "0", "tool": "x"}], lambda task: {"success": False})
+    assert llm.calls == planner.MAX_PLAN_ADJUSTMENTS
+    assert len(results) == planner.MAX_PLAN_ADJUSTMENTS + 1
+    print(f"✓ 计划调整最多 {planner.MAX_PLAN_ADJUSTMENTS} 次后终止")
+    
+    return True
+
+def test_extract_json():
+    print("\n" + "="*50)
+    print("测试 11: LLM 输出 JSON 提取")
+    print("="*50)
+    
+    from core.json_utils import extract_json
+    
+    cases = [
+        ('{"a": "x}y{", "b": 1}', {"a": "x}y{", "b": 1}),
+        ('结果 {"a": "say \\"hi\\" }", "b": 2} 完毕', {"a": 'say "hi" }', "b": 2}),
+        ('示例 {占位} 如下:\n```json\n{"a": 3}\n```', {"a": 3}),
+        ('```json\nnull\n```\n之后 {"a": 4}', {"a": 4}),
+        ('```json\n[]\n```\n没有对象', None),
+        ('{bad} {"a": 5}', {"a": 5}),
+        ('没有 JSON', None),
+        ('{"a": 1', None),
+        ('', None),
+    ]
+    for raw, expected in cases:
+        assert extract_json(raw) == expected, (raw, extract_json(raw))
+    print(f"✓ {len(cases)} 个用例通过")
+    
+    return True
+
+def test_memory_persistence():
+    print("\n" + "="*50)
+    print("测试 12: 短期记忆持久化")
+    print("="*50)
+    
+    import json
+    import os
+    import shutil
+    import tempfile
+    from core.memory import VectorMemory
+    
+    test_dir = tempfile.mkdtemp()
+    try:
+        memory = VectorMemory(root_dir=test_dir, max_short_term=3)
+        ids = [memory.add(f"第 {i} 条记忆") for i in range(5)]
+        memory.close()
+        
+        short_term_file = os.path.join(test_dir, "short_term.jsonl")
+        with open(short_term_file, encoding="utf-8") as f:
+            assert len(f.read().splitlines()) == 3
+        print("✓ 淘汰后短期记忆文件被重写，只保留最近 3 条")
+        
+        with open(short_term_file, "a", encoding="utf-8") as f:
+            f.write('{"id": "truncated", "cont')
+        
+        reloaded = VectorMemory(root_dir=test_dir, max_short_term=3)
+        assert list(reloaded.short_term_memory) == ids[-3:]
+        assert reloaded.short_term_memory[ids[-1]]["content"] == "第 4 条记忆"
+        reloaded.close()
+        print("✓ 新实例按顺序恢复记忆，跳过写入中断留下的半行")
+    finally:
+        shutil.rmtree(test_dir)
+    
+    legacy_dir = tempfile.mkdtemp()
+    try:
+        entry = {"id": "old", "content": "旧格式记忆", "metadata": {}, "importance": 0.5,
+                 "timestamp": 1.0, "access_count": 0}
+        with open(os.path.join(legacy_dir, "short_term.json"), "w", encoding="utf-8") as f:
+            json.dump({"old": entry}, f, ensure_ascii=False)
+        
+        memory = VectorMemory(root_dir=legacy_dir)
+        assert memory.short_term_memory["old"]["content"] == "旧格式记忆"
+        memory.close()
+        assert os.listdir(legacy_dir) == ["short_term.jsonl"]
+        
+        migrated = VectorMemory(root_dir=legacy_dir)
+        assert list(migrated.short_term_memory) == ["old"]
+        migrated.close()
+        print("✓ 旧版 short_term.json 迁移为 JSONL 并删除原文件")
+    finally:
+        shutil.rmtree(legacy_dir)
+    
+    return True
+
 def main():
     print("\n" + "="*50)
     print("Neo 系统测试")
@@ -153,6 +390,12 @@ def main():
         ("Task Planner", test_planner),
         ("ReAct Agent", test_react_agent),
         ("集成测试", test_integration),
+        ("凭证文件保护", test_unreadable_credentials),
+        ("代码块标记清理", test_strip_code_fence),
+        ("CodeGuard 自我保护", test_code_guard_self_protection),
+        ("任务依赖图", test_task_graph),
+        ("JSON 提取", test_extract_json),
+        ("记忆持久化", test_memory_persistence),
     ]
     
     passed = 0
@@ -3,6 +3,12 @@ import json
 import re
 from typing import Dict, List
 
+_TITLE_RE = re.compile(r'<title[^>]*>(.*?)</title>', re.DOTALL | re.IGNORECASE)
+_SCRIPT_RE = re.compile(r'<script[^>]*>.*?</script>', re.DOTALL | re.IGNORECASE)
+_STYLE_RE = re.compile(r'<style[^>]*>.*?</style>', re.DOTALL | re.IGNORECASE)
+_TAG_RE = re.compile(r'<[^>]+>')
+_WHITESPACE_RE = re.compile(r'\s+')
+
 class HttpSkill:
     """HTTP 请求工具 - 用于获取网页内容、API 数据等"""
     
@@ -230,13 +236,13 @@ class WebScraperSkill:
             
             content = response.text
             
-            title_match = re.search(r'<title[^>]*>(.*?)</title>', content, re.DOTALL | re.IGNORECASE)
+            title_match = _TITLE_RE.search(content)
             title = title_match.group(1).strip() if title_match else ""
             
-            text = re.sub(r'<script[^>]*>.*?</script>', '', content, flags=re.DOTALL | re.IGNORECASE)
-            text = re.sub(r'<style[^>]*>.*?</style>', '', text, flags=re.DOTALL | re.IGNORECASE)
-            text = re.sub(r'<[^>]+>', ' ', text)
-            text = re.sub(r'\s+', ' ', text).strip()
+            text = _SCRIPT_RE.sub('', content)
+            text = _STYLE_RE.sub('', text)
+            text = _TAG_RE.sub(' ', text)
+            text = _WHITESPACE_RE.sub(' ', text).strip()
             
             if len(text) > 3000:
                 text = text[:3000] + "\n... (内容已截断)"
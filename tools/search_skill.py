@@ -1,5 +1,4 @@
 import requests
-from bs4 import BeautifulSoup
 
 class SearchSkill:
     @staticmethod
@@ -53,6 +52,7 @@ class SearchSkill:
             response.raise_for_status()
             
             # 解析搜索结果
+            from bs4 import BeautifulSoup
             soup = BeautifulSoup(response.text, 'html.parser')
             results = []
             